@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import FitnessClass, Booking
+from .models import FitnessClass, Booking, ArchivedFitnessClass, ArchivedBooking
 
 admin.site.register(FitnessClass)
 admin.site.register(Booking)
+admin.site.register(ArchivedFitnessClass)
+admin.site.register(ArchivedBooking)
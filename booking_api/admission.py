@@ -0,0 +1,118 @@
+import threading
+from collections import deque
+from concurrent.futures import Future, TimeoutError
+from django.conf import settings
+from django.db import connection
+from rest_framework import serializers
+from .cache import get_capacity_version
+from .serializers import create_class_bookings
+
+
+class QueueFull(Exception):
+    pass
+
+
+class AdmissionQueue:
+    """
+    per class booking queues drained in batches
+
+    Concurrent bookings for one class are queued instead of each opening its own
+    transaction; a worker thread per busy class books up to
+    BOOKING_ADMISSION_MAX_BATCH of them per transaction with a single slot update
+    (create_class_bookings) and resolves each waiting request with its own result.
+    Classes found sold out are remembered so later requests are rejected without
+    touching the database, until the class's capacity version (shared through
+    the cache, bumped when the class is edited or rebalanced in any process) moves.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._workers = set()
+        # class id: capacity version it was found sold out at
+        self._sold_out = {}
+
+    def get_capacity_version(self, class_id):
+        """
+        the class's capacity version, read before its slots so a concurrent edit outdates the mark
+        """
+        try:
+            return get_capacity_version(int(class_id))
+        except (TypeError, ValueError):
+            return None
+
+    def is_sold_out(self, class_id, version):
+        try:
+            marked = self._sold_out.get(int(class_id))
+        except (TypeError, ValueError):
+            return False
+        return marked is not None and marked == version
+
+    def mark_sold_out(self, class_id, version):
+        if version is not None:
+            self._sold_out[int(class_id)] = version
+
+    def book(self, validated_data):
+        """
+        queue a validated booking and wait for its result, returns the booking or
+        raises the serializers.ValidationError the direct path would have raised
+        """
+        fitness_class = validated_data['fitness_class']
+        future = Future()
+        with self._lock:
+            queue = self._queues.setdefault(fitness_class.id, deque())
+            if len(queue) >= getattr(settings, 'BOOKING_ADMISSION_MAX_QUEUE', 1000):
+                raise QueueFull()
+            queue.append((validated_data, future))
+            if fitness_class.id not in self._workers:
+                self._workers.add(fitness_class.id)
+                threading.Thread(target=self._drain, args=(fitness_class,), daemon=True).start()
+
+        try:
+            booking, error = future.result(timeout=getattr(settings, 'BOOKING_ADMISSION_TIMEOUT', 10))
+        except TimeoutError:
+            # only give up on bookings the worker has not picked up yet
+            if future.cancel():
+                raise
+            booking, error = future.result()
+        if error is not None:
+            raise error
+        return booking
+
+    def _next_batch(self, class_id):
+        max_batch = getattr(settings, 'BOOKING_ADMISSION_MAX_BATCH', 100)
+        with self._lock:
+            queue = self._queues[class_id]
+            batch = [queue.popleft() for _ in range(min(max_batch, len(queue)))]
+            if not batch:
+                # checked and cleared under the lock so no booking is queued without a worker
+                del self._queues[class_id]
+                self._workers.discard(class_id)
+            return batch
+
+    def _drain(self, fitness_class):
+        try:
+            while batch := self._next_batch(fitness_class.id):
+                batch = [(data, future) for data, future in batch if future.set_running_or_notify_cancel()]
+                if not batch:
+                    continue
+                version = self.get_capacity_version(fitness_class.id)
+                try:
+                    results = create_class_bookings(fitness_class, list(enumerate(data for data, _ in batch)))
+                except Exception as e:
+                    for _, future in batch:
+                        future.set_exception(e)
+                    continue
+
+                for index, (_, future) in enumerate(batch):
+                    booking, error = results[index]
+                    if error is not None:
+                        if 'No available slots for this class' in error.get('error', []):
+                            self.mark_sold_out(fitness_class.id, version)
+                        error = serializers.ValidationError(error)
+                    future.set_result((booking, error))
+        finally:
+            connection.close()
+
+
+admission_queue = AdmissionQueue()
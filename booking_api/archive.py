@@ -0,0 +1,51 @@
+from django.db import router, transaction
+from .models import ArchivedBooking, ArchivedFitnessClass, Booking, FitnessClass
+from .stripes import available_slots_expression
+
+ARCHIVED_BOOKING_FIELDS = ('id', 'fitness_class_id', 'client_name', 'client_email', 'created_at')
+
+
+def archive_chunk(cutoff, chunk_size):
+    """
+    move up to chunk_size classes that started before cutoff, with their bookings,
+    in one transaction; returns (classes, bookings) moved
+    """
+    # every read, copy and delete on the primary, a lagging replica could miss bookings the cascade then deletes
+    using = router.db_for_write(FitnessClass)
+    with transaction.atomic(using=using):
+        # locked first so no booking for them can be inserted between the copy and the delete
+        class_ids = list(FitnessClass.objects.using(using).select_for_update().filter(start_time__lt=cutoff).order_by(
+            'start_time', 'id').values_list('id', flat=True)[:chunk_size])
+        if not class_ids:
+            return 0, 0
+
+        classes = FitnessClass.objects.using(using).filter(id__in=class_ids).values(
+            'id', 'name', 'instructor', 'start_time', slots=available_slots_expression())
+        ArchivedFitnessClass.objects.using(using).bulk_create([
+            ArchivedFitnessClass(id=row['id'], name=row['name'], instructor=row['instructor'],
+                                 start_time=row['start_time'], available_slots=row['slots'] or 0)
+            for row in classes
+        ])
+        bookings = [ArchivedBooking(**row) for row in Booking.objects.using(using).filter(
+            fitness_class_id__in=class_ids).values(*ARCHIVED_BOOKING_FIELDS)]
+        ArchivedBooking.objects.using(using).bulk_create(bookings, batch_size=1000)
+        # cascades to the bookings and slot stripes
+        FitnessClass.objects.using(using).filter(id__in=class_ids).delete()
+    return len(class_ids), len(bookings)
+
+
+def archive_past(cutoff, chunk_size=200):
+    """
+    move every class that started before cutoff, with its bookings, to the archive tables
+
+    Each chunk is its own transaction, so bookings of other classes only wait
+    for one chunk and an interrupted run leaves every class either archived or
+    untouched. Returns (classes, bookings) moved.
+    """
+    classes = bookings = 0
+    while True:
+        chunk_classes, chunk_bookings = archive_chunk(cutoff, chunk_size)
+        if not chunk_classes:
+            return classes, bookings
+        classes += chunk_classes
+        bookings += chunk_bookings
@@ -0,0 +1,69 @@
+import threading
+import time
+from django.conf import settings
+from django.db import router
+from .events import get_broker
+from .models import FitnessClass
+from .stripes import available_slots_expression
+
+
+class SlotSnapshot:
+    """
+    process local map of class id to available slots, for GET /classes/availability/
+
+    Each entry remembers the class's AVAILABILITY_BROKER version when it was
+    read. Bookings and class edits bump that version on commit, so only the
+    classes that changed are read again, with one id__in query for all of them.
+    Changes the broker does not see (other workers with the InProcessBroker,
+    queryset.update() outside the API) show up after at most
+    AVAILABILITY_SNAPSHOT_MAX_AGE seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # class id: (available slots, broker version, expires at)
+        self._entries = {}
+
+    def get_many(self, class_ids):
+        """
+        {class id: available slots} with None for unknown classes
+        """
+        # versions before the read, a change racing it leaves a stale version and is read again next time
+        versions = get_broker().get_versions(class_ids)
+        now = time.monotonic()
+        slots = {}
+        missing = []
+        for class_id in class_ids:
+            entry = self._entries.get(class_id)
+            if entry is not None and entry[1] == versions[class_id] and entry[2] > now:
+                slots[class_id] = entry[0]
+            else:
+                missing.append(class_id)
+        if missing:
+            slots.update(self.fetch(missing, versions, now))
+        return slots
+
+    def fetch(self, class_ids, versions, now):
+        # from the primary, a lagging replica could return the count from before the version bump
+        rows = FitnessClass.objects.using(router.db_for_write(FitnessClass)).filter(id__in=class_ids).values_list(
+            'id', available_slots_expression())
+        fetched = dict.fromkeys(class_ids)
+        fetched.update(rows)
+
+        expires_at = now + getattr(settings, 'AVAILABILITY_SNAPSHOT_MAX_AGE', 5)
+        max_classes = getattr(settings, 'AVAILABILITY_SNAPSHOT_MAX_CLASSES', 10000)
+        with self._lock:
+            if len(self._entries) + len(fetched) > max_classes:
+                self._entries = {class_id: entry for class_id, entry in self._entries.items() if entry[2] > now}
+                if len(self._entries) + len(fetched) > max_classes:
+                    self._entries = {}
+            for class_id, class_slots in fetched.items():
+                self._entries[class_id] = (class_slots, versions[class_id], expires_at)
+        return fetched
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+
+slot_snapshot = SlotSnapshot()
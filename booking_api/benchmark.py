@@ -0,0 +1,68 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def run_clients(request, clients, per_client):
+    """
+    call request(client, index) per_client times from each of `clients` threads released together
+
+    index is unique across all calls, e.g. for distinct client emails. Returns
+    the (seconds, status, queries) sample of every call and the wall time.
+    """
+    barrier = Barrier(clients)
+
+    def run_client(thread):
+        client = Client(SERVER_NAME='localhost')
+        samples = []
+        barrier.wait()
+        try:
+            for i in range(per_client):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    status = request(client, thread * per_client + i).status_code
+                    elapsed = time.perf_counter() - started
+                samples.append((elapsed, status, len(queries)))
+        finally:
+            connection.close()
+        return samples
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        samples = [sample for samples in executor.map(run_client, range(clients)) for sample in samples]
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    """
+    throughput, latency percentiles, queries and statuses of run_clients() samples
+    """
+    latencies = sorted(latency for latency, _, _ in samples)
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(samples),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(samples) / elapsed, 1),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'queries_per_request': round(sum(queries for _, _, queries in samples) / len(samples), 2) if samples else 0,
+        'statuses': statuses,
+    }
+
+
+def drive(request, clients, per_client):
+    """
+    the summary of run_clients(), the one harness behind every bench command
+    """
+    return summarize(*run_clients(request, clients, per_client))
@@ -0,0 +1,113 @@
+import hashlib
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+SCHEDULE_VERSION_KEY = 'booking_api:schedule_version'
+CAPACITY_VERSION_KEY = 'booking_api:capacity_version:%s'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'not_modified': 0}
+
+
+def get_schedule_version():
+    """
+    current schedule version, bumped whenever the class listing may have changed
+    """
+    version = cache.get(SCHEDULE_VERSION_KEY)
+    if version is None:
+        # time based start so a restarted cache never hands out ETags of an older schedule
+        cache.add(SCHEDULE_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(SCHEDULE_VERSION_KEY)
+    return version
+
+
+async def aget_schedule_version():
+    version = await cache.aget(SCHEDULE_VERSION_KEY)
+    if version is None:
+        await cache.aadd(SCHEDULE_VERSION_KEY, time.time_ns(), timeout=None)
+        version = await cache.aget(SCHEDULE_VERSION_KEY)
+    return version
+
+
+def bump_schedule_version():
+    try:
+        cache.incr(SCHEDULE_VERSION_KEY)
+    except ValueError:
+        cache.add(SCHEDULE_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def bump_schedule_version_on_commit(using=None):
+    """
+    bump once the change is visible to other connections, so a concurrent
+    request can not cache the old listing under the new version
+    """
+    transaction.on_commit(bump_schedule_version, using=using)
+
+
+def get_capacity_version(class_id):
+    """
+    current capacity version of a class, bumped whenever slots may have been added to it
+    """
+    key = CAPACITY_VERSION_KEY % class_id
+    version = cache.get(key)
+    if version is None:
+        # time based start like the schedule version, an evicted key never comes back with an old version
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_capacity_version(class_id):
+    key = CAPACITY_VERSION_KEY % class_id
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def bump_capacity_version_on_commit(class_id, using=None):
+    """
+    bump once the new capacity is visible to other connections, so no worker
+    marks the class sold out again under the new version
+    """
+    transaction.on_commit(lambda: bump_capacity_version(class_id), using=using)
+
+
+def get_listing_etag(request, version, tz_name):
+    """
+    strong ETag of a class listing page
+
+    The listing also changes as classes start, so the ETag rolls over every
+    CLASSES_CACHE_TIMEOUT seconds even when the schedule version does not.
+    """
+    timeout = getattr(settings, 'CLASSES_CACHE_TIMEOUT', 30)
+    key = ':'.join([
+        str(version),
+        str(int(time.time() // timeout)),
+        tz_name,
+        request.build_absolute_uri(),
+    ])
+    return '"%s"' % hashlib.sha1(key.encode()).hexdigest()
+
+
+def record_cache_event(event):
+    with _stats_lock:
+        _stats[event] += 1
+
+
+def get_cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses'] + stats['not_modified']
+    stats['hit_rate'] = (stats['hits'] + stats['not_modified']) / lookups if lookups else 0.0
+    return stats
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        for event in _stats:
+            _stats[event] = 0
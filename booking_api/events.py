@@ -0,0 +1,75 @@
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class InProcessBroker:
+    """
+    availability changes as per class version numbers in this process's memory
+
+    Publishing is a counter bump, subscribers compare versions once per stream
+    interval, so any number of changes between two polls becomes one event.
+    Only sees bookings made by the same process: single worker deployments.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+
+    def publish(self, class_id):
+        with self._lock:
+            self._versions[class_id] = self._versions.get(class_id, 0) + 1
+
+    def get_versions(self, class_ids):
+        return {class_id: self._versions.get(class_id, 0) for class_id in class_ids}
+
+    async def aget_versions(self, class_ids):
+        return self.get_versions(class_ids)
+
+
+class CacheBroker:
+    """
+    the same versions kept in the Django cache, shared by every worker using that
+    cache; a local stand-in for a real broker (e.g. a FileBasedCache on one host)
+    """
+    key_format = 'booking_api:availability:%s'
+
+    def publish(self, class_id):
+        key = self.key_format % class_id
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+
+    def get_versions(self, class_ids):
+        versions = cache.get_many([self.key_format % class_id for class_id in class_ids])
+        return {class_id: versions.get(self.key_format % class_id, 0) for class_id in class_ids}
+
+    async def aget_versions(self, class_ids):
+        versions = await cache.aget_many([self.key_format % class_id for class_id in class_ids])
+        return {class_id: versions.get(self.key_format % class_id, 0) for class_id in class_ids}
+
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def get_broker():
+    """
+    the AVAILABILITY_BROKER instance of this process
+    """
+    path = getattr(settings, 'AVAILABILITY_BROKER', 'booking_api.events.InProcessBroker')
+    with _brokers_lock:
+        if path not in _brokers:
+            _brokers[path] = import_string(path)()
+        return _brokers[path]
+
+
+def publish_availability_on_commit(class_id, using=None):
+    """
+    tell availability streams the class's slots changed, once the change is visible
+    """
+    transaction.on_commit(lambda: get_broker().publish(class_id), using=using)
@@ -0,0 +1,74 @@
+import csv
+import json
+from rest_framework import serializers
+from .models import Booking
+from .serializers import format_datetime, parse_datetime_param
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+EXPORT_COLUMNS = ('booking_id', 'class_id', 'class_name', 'instructor', 'start_time', 'client_name',
+                  'client_email', 'created_at')
+
+# .values_list() fields in EXPORT_COLUMNS order
+EXPORT_FIELDS = ('id', 'fitness_class_id', 'fitness_class__name', 'fitness_class__instructor',
+                 'fitness_class__start_time', 'client_name', 'client_email', 'created_at')
+
+
+def get_export_bookings(params, tz_name):
+    """
+    bookings filtered by the class_id, email, start and end (class start time) parameters
+
+    an end date includes that whole day, like the /classes/ "to" date
+    """
+    bookings = Booking.objects.all()
+    if params.get('class_id'):
+        try:
+            bookings = bookings.filter(fitness_class_id=int(params['class_id']))
+        except ValueError:
+            raise serializers.ValidationError({"error": "Invalid class_id"})
+    if params.get('email'):
+        bookings = bookings.filter(client_email=params['email'])
+    if params.get('start'):
+        start = parse_datetime_param(params['start'], tz_name, 'start')
+        bookings = bookings.filter(fitness_class__start_time__gte=start)
+    if params.get('end'):
+        end = parse_datetime_param(params['end'], tz_name, 'end', end_of_day=True)
+        bookings = bookings.filter(fitness_class__start_time__lt=end)
+    return bookings.order_by('id')
+
+
+def iter_export_rows(bookings, tz_name, chunk_size=2000):
+    """
+    one tuple per booking in EXPORT_COLUMNS order, fetched chunk_size rows at a time
+    """
+    for row in bookings.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size):
+        row = list(row)
+        row[4] = format_datetime(row[4], tz_name)
+        row[7] = format_datetime(row[7], tz_name)
+        yield row
+
+
+class Echo:
+    """
+    file-like object handing back what csv.writer writes instead of buffering it
+    """
+
+    def write(self, value):
+        return value
+
+
+def render_export(rows, export_format):
+    """
+    encode rows as NDJSON or CSV lines, one line at a time
+    """
+    if export_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(EXPORT_COLUMNS)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(EXPORT_COLUMNS, row))) + '\n'
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def get_fingerprint(request):
+    """
+    hash of what the key promises to repeat: method, path and parsed body
+
+    request.data rather than the raw body, which can not be read any more
+    once the throttles have parsed it in APIView.initial()
+    """
+    body = json.dumps(request.data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256('\n'.join([request.method, request.path, body]).encode()).hexdigest()
+
+
+def key_reused():
+    return Response({"error": "Idempotency-Key was already used for a different request"},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+
+def replay(stored):
+    return Response(stored['data'], status=stored['status'], headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(post):
+    """
+    answer repeats of a POST carrying an Idempotency-Key header from the stored first response
+
+    The first response below 500 is kept for IDEMPOTENCY_KEY_TTL seconds and
+    repeats are replayed without validation or a transaction. While the first
+    request is in flight its key is held with cache.add(), so concurrent repeats
+    wait for its response instead of booking again.
+    """
+
+    @wraps(post)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return post(self, request, *args, **kwargs)
+        if not key or len(key) > 255:
+            return Response({"error": "Idempotency-Key must be 1 to 255 characters"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = get_fingerprint(request)
+        result_key = f'booking_api:idempotency:{key}'
+        lock_key = f'{result_key}:lock'
+        deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT_TIMEOUT', 10)
+        delay = 0.005
+        while True:
+            stored = cache.get(result_key)
+            if stored is None and cache.add(lock_key, fingerprint, getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 30)):
+                try:
+                    # the first request may have finished between the get and the add
+                    stored = cache.get(result_key)
+                    if stored is None:
+                        response = post(self, request, *args, **kwargs)
+                        if response.status_code < 500:
+                            cache.set(result_key, {'fingerprint': fingerprint, 'status': response.status_code,
+                                                   'data': response.data},
+                                      getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+                        return response
+                finally:
+                    cache.delete(lock_key)
+
+            if stored is not None:
+                if stored['fingerprint'] != fingerprint:
+                    return key_reused()
+                return replay(stored)
+            in_flight = cache.get(lock_key)
+            if in_flight is not None and in_flight != fingerprint:
+                return key_reused()
+            if time.monotonic() >= deadline:
+                return Response({"error": "A request with this Idempotency-Key is still in progress"},
+                                status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+            # the first request is in flight, wait for its response (or for it to fail and release the key)
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    return wrapper
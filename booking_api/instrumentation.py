@@ -0,0 +1,52 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+
+_timings = ContextVar('booking_api_timings', default=None)
+
+
+def start_timings():
+    """
+    start collecting timed() sections for the current request, returns the dict they go into
+    """
+    timings = {}
+    return timings, _timings.set(timings)
+
+
+def stop_timings(token):
+    _timings.reset(token)
+
+
+@contextmanager
+def timed(name):
+    """
+    add the time spent in the block to the current request's Server-Timing entry `name`
+    """
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + perf_counter() - started
+
+
+class QueryTimer:
+    """
+    execute_wrapper counting queries and the time spent running them
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += perf_counter() - started
@@ -1,7 +1,12 @@
-from django.core.management import BaseCommand
+import argparse
+import random
+import time
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from ...cache import bump_schedule_version
 from ...models import FitnessClass, Booking
-from datetime import datetime
-from django.utils.timezone import make_aware
+from datetime import datetime, timedelta
+from django.utils.timezone import localdate, make_aware
 
 
 SAMPLE_CLASSES = {
@@ -35,10 +40,51 @@ SAMPLE_BOOKINGs = {
 }
 
 
+CLASS_NAMES = ['Yoga', 'Zumba', 'HIIT', 'Pilates', 'Spin', 'Boxing', 'Barre', 'CrossFit', 'Stretch', 'Bootcamp']
+
+FIRST_NAMES = ['Alice', 'Bob', 'Charlie', 'Dana', 'Eve', 'Frank', 'Grace', 'Heidi', 'Ivan', 'Judy', 'Mallory',
+               'Niaj', 'Olivia', 'Peggy', 'Rupert', 'Sybil', 'Trent', 'Uma', 'Victor', 'Wendy']
+
+# classes start on the quarter hour between 06:00 and 21:45
+START_SLOTS = 16 * 4
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'must be a positive integer, got {value}')
+    return number
+
+
+def non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f'must be zero or a positive integer, got {value}')
+    return number
+
+
 class Command(BaseCommand):
     help = 'Add sample data to the database'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--classes', type=non_negative_int, default=0,
+                            help='Generate this many classes instead of the small sample')
+        parser.add_argument('--bookings', type=non_negative_int, default=0,
+                            help='Bookings to generate across those classes')
+        parser.add_argument('--instructors', type=positive_int, default=50, help='Distinct instructors')
+        parser.add_argument('--clients', type=non_negative_int, default=None,
+                            help='Distinct client emails, defaults to a tenth of the bookings (at least 1000)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, the same seed gives the same data')
+        parser.add_argument('--start-date', type=datetime.fromisoformat, default=None,
+                            help='First day of the schedule (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--chunk-size', type=positive_int, default=5000, help='Classes inserted per transaction')
+
+    def handle(self, *args, **options):
+        if options['classes']:
+            return self.generate(options)
+        if options['bookings']:
+            raise CommandError('--bookings needs --classes to spread them over')
+
         for name, data in SAMPLE_CLASSES.items():
             # create if not exists
             _, is_created = FitnessClass.objects.get_or_create(name=name, defaults=data)
@@ -55,3 +101,61 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.SUCCESS(f'Sample booking for class {name} added successfully'))
             else:
                 self.stdout.write(self.style.SUCCESS(f'Sample booking for class {name} already exists'))
+
+    def generate(self, options):
+        """
+        deterministic bulk schedule: classes are inserted chunk by chunk together
+        with their bookings, so memory stays bounded by --chunk-size
+        """
+        rng = random.Random(options['seed'])
+        total_classes, total_bookings = options['classes'], options['bookings']
+        instructors = [f'{FIRST_NAMES[i % len(FIRST_NAMES)]} {i // len(FIRST_NAMES) + 1}'
+                       for i in range(options['instructors'])]
+        clients = options['clients'] or max(1000, total_bookings // 10)
+        start_date = (options['start_date'] or datetime.combine(localdate(), datetime.min.time())).date()
+        first_start = make_aware(datetime.combine(start_date, datetime.min.time()) + timedelta(hours=6))
+        # about two classes per instructor per day
+        days = max(1, -(-total_classes // (2 * len(instructors))))
+
+        # spread the bookings evenly, the remainder going to randomly picked classes
+        per_class, remainder = divmod(total_bookings, total_classes)
+        if per_class >= clients or (remainder and per_class + 1 > clients):
+            raise CommandError('Not enough clients for the bookings per class, raise --clients')
+        extra = set(rng.sample(range(total_classes), remainder))
+
+        started = time.perf_counter()
+        created_classes = created_bookings = 0
+        for chunk_start in range(0, total_classes, options['chunk_size']):
+            chunk = range(chunk_start, min(chunk_start + options['chunk_size'], total_classes))
+            booked = [per_class + (i in extra) for i in chunk]
+            classes = [
+                FitnessClass(
+                    name=rng.choice(CLASS_NAMES),
+                    instructor=rng.choice(instructors),
+                    start_time=first_start + timedelta(days=rng.randrange(days),
+                                                       minutes=15 * rng.randrange(START_SLOTS)),
+                    available_slots=rng.randint(0, 10),
+                )
+                for _ in chunk
+            ]
+            with transaction.atomic():
+                FitnessClass.objects.bulk_create(classes)
+                bookings = [
+                    Booking(fitness_class=fitness_class, client_name=f'Client {client}',
+                            client_email=f'client{client}@example.com')
+                    for fitness_class, count in zip(classes, booked)
+                    for client in rng.sample(range(clients), count)
+                ]
+                Booking.objects.bulk_create(bookings, batch_size=options['chunk_size'])
+
+            created_classes += len(classes)
+            created_bookings += len(bookings)
+            self.stdout.write(f'{created_classes}/{total_classes} classes, '
+                              f'{created_bookings}/{total_bookings} bookings '
+                              f'({time.perf_counter() - started:.1f}s)')
+
+        # bulk_create skips the signals that invalidate the cached class listing
+        bump_schedule_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {created_classes} classes and {created_bookings} bookings '
+            f'in {time.perf_counter() - started:.1f}s'))
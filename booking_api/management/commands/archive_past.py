@@ -0,0 +1,35 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework import serializers
+from ...archive import archive_past
+from ...serializers import parse_datetime_param
+
+
+class Command(BaseCommand):
+    help = 'Move classes that started before a cutoff, with their bookings, to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='Cutoff date or ISO datetime (TIME_ZONE), overrides --days')
+        parser.add_argument('--days', type=int, default=getattr(settings, 'ARCHIVE_AFTER_DAYS', 30),
+                            help='Archive classes that started more than this many days ago')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Classes moved per transaction')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                cutoff = parse_datetime_param(options['before'], timezone.get_current_timezone_name(), 'before')
+            except serializers.ValidationError as e:
+                raise CommandError(e.detail['error'])
+        else:
+            cutoff = timezone.now() - timedelta(days=options['days'])
+        if cutoff > timezone.now():
+            raise CommandError('The cutoff must be in the past, upcoming classes are never archived')
+
+        started = time.perf_counter()
+        classes, bookings = archive_past(cutoff, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {classes} classes and {bookings} bookings that started before {cutoff.isoformat()} '
+            f'in {time.perf_counter() - started:.1f}s'))
@@ -0,0 +1,97 @@
+import json
+import logging
+import random
+import subprocess
+from datetime import timedelta
+from django.core.management import BaseCommand
+from django.db.models import Count, F, Sum
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from ...benchmark import drive
+from ...models import FitnessClass, Booking
+
+
+class Command(BaseCommand):
+    help = 'Load test /classes/, /book/ and /bookings/ and write the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--classes', type=int, default=200, help='Classes to seed')
+        parser.add_argument('--slots', type=int, default=20, help='Slots per seeded class')
+        parser.add_argument('--clients', type=int, default=20, help='Simultaneous client threads')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per client and endpoint')
+        parser.add_argument('--endpoints', default='classes,book,bookings',
+                            help='Comma separated endpoints to drive, in order')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed')
+        parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data')
+
+    # the load comes from one IP at rates no real client reaches, throttling it would measure the throttles
+    @override_settings(BOOKING_THROTTLE_RATES={})
+    def handle(self, *args, **options):
+        self.options = options
+        self.random = random.Random(options['seed'])
+        # expected 400s (sold out, duplicates) would otherwise log a warning per request
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        self.seed()
+        try:
+            results = {
+                'commit': self.get_commit(),
+                'started_at': timezone.now().isoformat(),
+                'options': {key: options[key] for key in
+                            ('classes', 'slots', 'clients', 'requests', 'endpoints', 'seed')},
+                'endpoints': {},
+            }
+            for endpoint in options['endpoints'].split(','):
+                results['endpoints'][endpoint] = drive(getattr(self, f'request_{endpoint}'), options['clients'],
+                                                       options['requests'])
+            results['violations'] = self.get_violations()
+        finally:
+            if not options['keep']:
+                FitnessClass.objects.filter(id__in=self.class_ids).delete()
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def seed(self):
+        start_time = timezone.now() + timedelta(days=1)
+        classes = FitnessClass.objects.bulk_create([
+            FitnessClass(name=f'Bench {i}', instructor=f'Bench instructor {i % 20}',
+                         start_time=start_time + timedelta(minutes=15 * i), available_slots=self.options['slots'])
+            for i in range(self.options['classes'])
+        ], batch_size=500)
+        self.class_ids = [fitness_class.id for fitness_class in classes]
+        self.emails = [f'bench{i}@example.com' for i in range(self.options['clients'] * 5)]
+
+    def request_classes(self, client, index):
+        return client.get(reverse('classes'))
+
+    def request_book(self, client, index):
+        return client.post(reverse('book'), {
+            'class_id': self.random.choice(self.class_ids),
+            'client_name': 'Bench',
+            'client_email': self.random.choice(self.emails),
+        })
+
+    def request_bookings(self, client, index):
+        return client.get(reverse('bookings'), {'email': self.random.choice(self.emails)})
+
+    def get_violations(self):
+        classes = FitnessClass.objects.filter(id__in=self.class_ids).annotate(booked=Count('booking'))
+        overbooked = classes.exclude(booked=self.options['slots'] - F('available_slots')).count()
+        duplicates = Booking.objects.filter(fitness_class_id__in=self.class_ids).values(
+            'fitness_class_id', 'client_email').annotate(n=Count('id')).filter(n__gt=1).aggregate(
+            total=Sum('n'))['total'] or 0
+        return {'overbooked_classes': overbooked, 'duplicate_bookings': duplicates}
+
+    def get_commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,45 @@
+from datetime import timedelta
+from django.core.management import BaseCommand
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from ...benchmark import drive
+from ...models import FitnessClass, Booking
+
+
+class Command(BaseCommand):
+    help = 'Compare POST /book/ with and without the admission queue on one hot class'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=50, help='Simultaneous clients')
+        parser.add_argument('--bookings', type=int, default=20, help='Bookings per client')
+        parser.add_argument('--slots', type=int, default=None,
+                            help='Class capacity, defaults to every booking fitting')
+
+    # the load comes from one IP at rates no real client reaches, throttling it would measure the throttles
+    @override_settings(BOOKING_THROTTLE_RATES={})
+    def handle(self, *args, **options):
+        for admission in (False, True):
+            with override_settings(BOOKING_ADMISSION_QUEUE=admission):
+                self.run('admission queue' if admission else 'direct', options)
+
+    def run(self, name, options):
+        threads, per_thread = options['threads'], options['bookings']
+        slots = options['slots'] or threads * per_thread
+        fitness_class = FitnessClass.objects.create(name='Bench', instructor='Bench', available_slots=slots,
+                                                    start_time=timezone.now() + timedelta(days=1))
+
+        def book(client, index):
+            return client.post(reverse('book'), {'class_id': fitness_class.id, 'client_name': 'Bench',
+                                                 'client_email': f'bench{index}@example.com'})
+
+        summary = drive(book, threads, per_thread)
+        created = summary['statuses'].get('201', 0)
+        errors = sum(count for status, count in summary['statuses'].items() if int(status) >= 500)
+        fitness_class.refresh_from_db()
+        booked = Booking.objects.filter(fitness_class=fitness_class).count()
+        self.stdout.write(
+            f"{name:>16}: {created / summary['seconds']:8.1f} bookings/s, "
+            f"p50 {summary['p50_ms']:7.1f} ms, p99 {summary['p99_ms']:7.1f} ms, {errors} errors, "
+            f'overbooked: {booked > slots or booked + fitness_class.available_slots != slots}')
+        fitness_class.delete()
@@ -0,0 +1,80 @@
+import asyncio
+import statistics
+import time
+from django.core.management import BaseCommand
+from django.urls import reverse
+from django.test import override_settings
+from fictional_fitness_backend.asgi import application
+
+
+class Command(BaseCommand):
+    help = 'Compare the sync and async read views under many simultaneous slow clients, through ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200, help='Simultaneous clients')
+        parser.add_argument('--requests', type=int, default=5, help='Requests per client')
+        parser.add_argument('--delay', type=float, default=0.05,
+                            help='Seconds each slow client takes to send its request and to read the response')
+        parser.add_argument('--email', default='VXg9y@example.com', help='Email for the bookings endpoints')
+
+    # the load comes from one IP at rates no real client reaches, throttling it would measure the throttles
+    @override_settings(BOOKING_THROTTLE_RATES={})
+    def handle(self, *args, **options):
+        query = f"email={options['email']}"
+        variants = [
+            ('classes (sync)', reverse('classes'), ''),
+            ('classes (async)', reverse('async-classes'), ''),
+            ('bookings (sync)', reverse('bookings'), query),
+            ('bookings (async)', reverse('async-bookings'), query),
+        ]
+        for name, path, query_string in variants:
+            elapsed, latencies, errors = asyncio.run(self.run(path, query_string, options))
+            latencies.sort()
+            self.stdout.write(
+                f'{name:>17}: {len(latencies) / elapsed:8.1f} req/s, '
+                f'p50 {statistics.median(latencies) * 1000:7.1f} ms, '
+                f'p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:7.1f} ms, {errors} errors')
+
+    async def run(self, path, query_string, options):
+        latencies, errors = [], 0
+
+        async def client():
+            nonlocal errors
+            for _ in range(options['requests']):
+                elapsed, status = await self.request(path, query_string, options['delay'])
+                latencies.append(elapsed)
+                errors += status != 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(options['clients'])))
+        return time.perf_counter() - started, latencies, errors
+
+    async def request(self, path, query_string, delay):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+            'query_string': query_string.encode(), 'headers': [(b'host', b'localhost')],
+            'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+        }
+        status = None
+        received = False
+
+        async def receive():
+            nonlocal received
+            if received:
+                # the client stays connected until the handler is done with it
+                await asyncio.Future()
+            received = True
+            await asyncio.sleep(delay)
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif not message.get('more_body'):
+                await asyncio.sleep(delay)
+
+        started = time.perf_counter()
+        await application(scope, receive, send)
+        return time.perf_counter() - started, status
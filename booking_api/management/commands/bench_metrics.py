@@ -0,0 +1,64 @@
+import time
+from django.core.management import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import resolve, reverse
+from ...benchmark import run_clients, summarize
+from ...metrics import Counter, Histogram, get_booking_outcome, record_request, registry
+
+
+class Command(BaseCommand):
+    help = 'Measure the cost of recording metrics, alone and on whole /classes/ and /bookings/ requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operations', type=int, default=200000, help='Calls per recording operation')
+        parser.add_argument('--http-requests', type=int, default=2000, help='Requests per endpoint and variant')
+
+    @override_settings(BOOKING_THROTTLE_RATES={})
+    def handle(self, *args, **options):
+        request = RequestFactory().get(reverse('classes'))
+        request.resolver_match = resolve(request.path)
+        response = HttpResponse()
+        counter = Counter('bench_total', 'bench', ['view', 'method', 'status'])
+        histogram = Histogram('bench_seconds', 'bench', ['view'])
+        operations = [
+            ('counter inc', lambda: counter.inc('FitnessClassListView', 'GET', '200')),
+            ('histogram observe', lambda: histogram.observe(0.0042, 'FitnessClassListView')),
+            ('booking outcome', lambda: get_booking_outcome(400, {'error': ['No available slots for this class']})),
+            ('record request', lambda: record_request(request, response, 0.0042)),
+        ]
+        for name, operation in operations:
+            started = time.perf_counter()
+            for _ in range(options['operations']):
+                operation()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{name:>18}: {elapsed / options["operations"] * 1e9:6.0f} ns')
+
+        # the whole recording path in context, compared with METRICS_ENABLED off
+        rounds = max(1, options['http_requests'] // 100)
+        for name, url, params in [('/classes/', reverse('classes'), {}),
+                                  ('/bookings/', reverse('bookings'), {'email': 'bench@example.com'})]:
+            def get(client, index):
+                return client.get(url, params)
+
+            run_clients(get, 1, 1)
+            samples = {False: [], True: []}
+            elapsed = {False: 0.0, True: 0.0}
+            # alternate the variants every 100 requests so drift and noise hit both alike
+            for _ in range(rounds):
+                for enabled in (False, True):
+                    with override_settings(METRICS_ENABLED=enabled):
+                        round_samples, round_elapsed = run_clients(get, 1, 100)
+                    samples[enabled] += round_samples
+                    elapsed[enabled] += round_elapsed
+            off, on = (summarize(samples[enabled], elapsed[enabled]) for enabled in (False, True))
+            self.stdout.write(f"{name:>10} request: mean {off['mean_ms'] * 1000:.0f} us (p99 {off['p99_ms']:.2f} ms) "
+                              f"without metrics, {on['mean_ms'] * 1000:.0f} us (p99 {on['p99_ms']:.2f} ms) with them "
+                              f"({(on['mean_ms'] - off['mean_ms']) * 1000:+.0f} us)")
+
+        # after the requests above, so the registry holds their series
+        started = time.perf_counter()
+        for _ in range(100):
+            text = registry.render()
+        self.stdout.write(f'render /metrics/: {(time.perf_counter() - started) * 10:6.2f} ms '
+                          f'({len(text.splitlines())} lines)')
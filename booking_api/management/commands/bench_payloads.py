@@ -0,0 +1,72 @@
+import time
+from datetime import timedelta
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from ...models import FitnessClass, Booking
+from ...renderers import FastJSONRenderer, orjson
+from ...serializers import BookingProjection, FitnessClassProjection
+
+
+class Command(BaseCommand):
+    help = 'Compare payload size and render time of full, sparse and normalized list responses per renderer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Classes, and bookings of one client')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per variant, the best run is reported')
+        parser.add_argument('--tz', default='America/New_York', help='Timezone to render times in')
+
+    def handle(self, *args, **options):
+        rows, repeat, tz_name = options['rows'], options['repeat'], options['tz']
+        if orjson is None:
+            self.stderr.write('orjson is not installed, FastJSONRenderer falls back to JSONRenderer')
+
+        # seed inside a transaction that is rolled back so the database is left untouched
+        with transaction.atomic():
+            start_time = timezone.now() + timedelta(days=1)
+            classes = FitnessClass.objects.bulk_create([
+                FitnessClass(name=f'Bench {i}', instructor=f'Instructor {i % 50}',
+                             start_time=start_time + timedelta(minutes=30 * (i % 2000)), available_slots=20)
+                for i in range(rows)
+            ], batch_size=1000)
+            Booking.objects.bulk_create([
+                Booking(fitness_class=fitness_class, client_name='Bench', client_email='bench@example.com')
+                for fitness_class in classes
+            ], batch_size=1000)
+            class_queryset = FitnessClass.objects.filter(name__startswith='Bench').order_by('start_time', 'id')
+            booking_queryset = Booking.objects.filter(client_email='bench@example.com').order_by('created_at', 'id')
+
+            variants = [
+                ('classes', lambda: FitnessClassProjection(tz_name), class_queryset),
+                ('classes fields=id,start_time,available_slots',
+                 lambda: FitnessClassProjection(tz_name, ('id', 'start_time', 'available_slots')), class_queryset),
+                ('bookings', lambda: BookingProjection(tz_name), booking_queryset),
+                ('bookings fields=id,created_at',
+                 lambda: BookingProjection(tz_name, ('id', 'created_at')), booking_queryset),
+                ('bookings normalize=true', lambda: BookingProjection(tz_name, normalize=True), booking_queryset),
+            ]
+            for name, get_projection, queryset in variants:
+                def project():
+                    projection = get_projection()
+                    data = {'next': None, 'results': projection.to_representation(
+                        list(projection.get_queryset(queryset)))}
+                    if getattr(projection, 'normalize', False):
+                        data['classes'] = list(projection.classes.values())
+                    return data
+
+                best, data = min((self.time(project) for _ in range(repeat)), key=lambda run: run[0])
+                timings = []
+                for renderer in (JSONRenderer(), FastJSONRenderer()):
+                    render_time, payload = min((self.time(lambda: renderer.render(data)) for _ in range(repeat)),
+                                               key=lambda run: run[0])
+                    timings.append(f'{type(renderer).__name__} {render_time * 1000:7.1f} ms')
+                self.stdout.write(f'{name:>45}: {len(payload) / 1024:8.1f} KiB, query+project {best * 1000:7.1f} ms, '
+                                  + ', '.join(timings))
+
+            transaction.set_rollback(True)
+
+    def time(self, run):
+        started = time.perf_counter()
+        result = run()
+        return time.perf_counter() - started, result
@@ -0,0 +1,49 @@
+import time
+from datetime import timedelta
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from ...models import FitnessClass
+from ...serializers import FitnessClassListSerializer, FitnessClassProjection
+
+
+class Command(BaseCommand):
+    help = 'Compare per-row cost of the class list serializer and the fast projection path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Number of classes to list')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per variant, the best run is reported')
+        parser.add_argument('--tz', default='America/New_York', help='Timezone to render start times in')
+
+    def handle(self, *args, **options):
+        rows, repeat, tz_name = options['rows'], options['repeat'], options['tz']
+
+        # seed inside a transaction that is rolled back so the database is left untouched
+        with transaction.atomic():
+            start_time = timezone.now() + timedelta(days=1)
+            FitnessClass.objects.bulk_create([
+                FitnessClass(name=f'Bench {i}', instructor=f'Instructor {i % 50}',
+                             start_time=start_time + timedelta(minutes=30 * (i % 2000)), available_slots=20)
+                for i in range(rows)
+            ], batch_size=1000)
+            queryset = FitnessClass.objects.filter(name__startswith='Bench').order_by('start_time', 'id')
+
+            def serializer():
+                with timezone.override(tz_name):
+                    return FitnessClassListSerializer(list(queryset), many=True).data
+
+            def projection():
+                fast = FitnessClassProjection(tz_name)
+                return fast.to_representation(list(fast.get_queryset(queryset)))
+
+            for name, run in [('ModelSerializer', serializer), ('projection', projection)]:
+                best = min(self.time(run) for _ in range(repeat))
+                self.stdout.write(f'{name:>16}: {best * 1000:8.1f} ms total, '
+                                  f'{best / rows * 1e6:6.2f} us/row ({rows} rows, best of {repeat})')
+
+            transaction.set_rollback(True)
+
+    def time(self, run):
+        started = time.perf_counter()
+        run()
+        return time.perf_counter() - started
@@ -0,0 +1,48 @@
+import logging
+from datetime import timedelta
+from django.core.management import BaseCommand
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from ...benchmark import drive
+from ...models import FitnessClass
+from ...stripes import rebalance
+
+
+class Command(BaseCommand):
+    help = 'Compare bookings/sec on one hot class with a single slot counter and with striped counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', default='1,8,32,64', help='Comma separated client thread counts')
+        parser.add_argument('--bookings', type=int, default=20, help='Bookings per client')
+        parser.add_argument('--stripes', type=int, default=16, help='Stripes of the striped class')
+
+    # the load comes from one IP at rates no real client reaches, throttling it would measure the throttles
+    @override_settings(BOOKING_THROTTLE_RATES={})
+    def handle(self, *args, **options):
+        # contended bookings are slow by design, skip the per request slow log
+        logging.getLogger('booking_api.requests').setLevel(logging.ERROR)
+        for threads in [int(n) for n in options['concurrency'].split(',')]:
+            single = self.run(threads, options['bookings'], 0)
+            striped = self.run(threads, options['bookings'], options['stripes'])
+            self.stdout.write(f"{threads:>4} clients: single counter {self.describe(single)}, "
+                              f"{options['stripes']} stripes {self.describe(striped)}")
+
+    def describe(self, summary):
+        created = summary['statuses'].get('201', 0)
+        return f"{created / summary['seconds']:8.1f} bookings/s, p99 {summary['p99_ms']:7.1f} ms"
+
+    def run(self, threads, per_thread, stripes):
+        fitness_class = FitnessClass.objects.create(name='Bench', instructor='Bench',
+                                                    available_slots=threads * per_thread,
+                                                    start_time=timezone.now() + timedelta(days=1))
+        if stripes:
+            rebalance(fitness_class, stripes)
+
+        def book(client, index):
+            return client.post(reverse('book'), {'class_id': fitness_class.id, 'client_name': 'Bench',
+                                                 'client_email': f'bench{index}@example.com'})
+
+        summary = drive(book, threads, per_thread)
+        fitness_class.delete()
+        return summary
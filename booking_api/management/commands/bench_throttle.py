@@ -0,0 +1,59 @@
+import time
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.request import Request
+from rest_framework.parsers import JSONParser
+from rest_framework.test import APIRequestFactory
+from ...benchmark import drive
+from ...throttling import (BookingIPThrottle, BookingEmailThrottle, BookingClassThrottle, LookupIPThrottle,
+                           LookupEmailThrottle)
+
+UNLIMITED = '1000000000/s'
+
+
+class Command(BaseCommand):
+    help = 'Measure the cost of the token bucket throttle decisions, alone and on a /bookings/ request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000, help='Throttle checks per scenario')
+        parser.add_argument('--http-requests', type=int, default=1000, help='/bookings/ requests per variant')
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        book = Request(factory.post(reverse('book'), {'class_id': 1, 'client_name': 'Bench',
+                                                      'client_email': 'bench@example.com'}, format='json'),
+                       parsers=[JSONParser()])
+        lookup = Request(factory.get(reverse('bookings'), {'email': 'bench@example.com'}))
+        # parse the body once, as DRF has done by the time the throttles run
+        book.data
+
+        self.stdout.write(f"cache backend: {settings.CACHES['default']['BACKEND']}")
+        book_throttles = [BookingIPThrottle, BookingEmailThrottle, BookingClassThrottle]
+        lookup_throttles = [LookupIPThrottle, LookupEmailThrottle]
+        for name, request, throttle_classes, rate in [('book, allowed', book, book_throttles, UNLIMITED),
+                                                      ('book, rejected', book, book_throttles, '1/day'),
+                                                      ('lookup, allowed', lookup, lookup_throttles, UNLIMITED)]:
+            with override_settings(BOOKING_THROTTLE_RATES={throttle.scope: rate for throttle in throttle_classes}):
+                started = time.perf_counter()
+                for _ in range(options['requests']):
+                    for throttle_class in throttle_classes:
+                        throttle_class().allow_request(request, None)
+                elapsed = time.perf_counter() - started
+            per_request = elapsed / options['requests'] * 1e6
+            self.stdout.write(f'{name:>16}: {per_request:6.2f} us/request, '
+                              f'{per_request / len(throttle_classes):6.2f} us/decision')
+
+        # the same decisions in context, on a whole (empty) /bookings/ lookup
+        def lookup_bookings(client, index):
+            return client.get(reverse('bookings'), {'email': 'bench@example.com'})
+
+        summaries = {}
+        for name, rates in [('off', {}), ('on', {throttle.scope: UNLIMITED for throttle in lookup_throttles})]:
+            with override_settings(BOOKING_THROTTLE_RATES=rates):
+                summaries[name] = drive(lookup_bookings, 1, options['http_requests'])
+        off, on = summaries['off'], summaries['on']
+        self.stdout.write(f"/bookings/ request: mean {off['mean_ms'] * 1000:.0f} us (p99 {off['p99_ms']:.2f} ms) "
+                          f"without throttles, {on['mean_ms'] * 1000:.0f} us (p99 {on['p99_ms']:.2f} ms) with them "
+                          f"({(on['mean_ms'] - off['mean_ms']) * 1000:+.0f} us)")
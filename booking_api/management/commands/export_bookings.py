@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework import serializers
+from ...export import EXPORT_FORMATS, get_export_bookings, iter_export_rows, render_export
+from ...serializers import get_zone
+
+
+class Command(BaseCommand):
+    help = 'Stream bookings joined to their class as NDJSON or CSV, filtered by class, email or date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--class-id', help='Only bookings of this class (its roster)')
+        parser.add_argument('--email', help='Only bookings of this client')
+        parser.add_argument('--start', help='Classes starting at or after this date or ISO datetime')
+        parser.add_argument('--end', help='Classes starting before this ISO datetime or on or before this date')
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--tz', help='Timezone of the exported times, TIME_ZONE by default')
+        parser.add_argument('--output', help='File to write, stdout by default')
+        parser.add_argument('--chunk-size', type=int, default=getattr(settings, 'EXPORT_CHUNK_SIZE', 2000),
+                            help='Rows fetched per query')
+
+    def handle(self, *args, **options):
+        tz_name = options['tz'] or timezone.get_current_timezone_name()
+        try:
+            get_zone(tz_name)
+            bookings = get_export_bookings({
+                'class_id': options['class_id'],
+                'email': options['email'],
+                'start': options['start'],
+                'end': options['end'],
+            }, tz_name)
+        except serializers.ValidationError as e:
+            raise CommandError(e.detail['error'])
+        except (ValueError, LookupError):
+            raise CommandError('Unknown timezone')
+
+        lines = render_export(iter_export_rows(bookings, tz_name, options['chunk_size']), options['format'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
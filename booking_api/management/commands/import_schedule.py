@@ -0,0 +1,36 @@
+import json
+import sys
+import time
+from django.core.management import BaseCommand, CommandError
+from ...schedules import RecurringScheduleSerializer, import_schedules
+
+
+class Command(BaseCommand):
+    help = 'Expand recurring timetables from a JSON file into classes, skipping occurrences that already exist'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSON list of schedules, - reads stdin')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Classes inserted per INSERT statement')
+
+    def handle(self, *args, **options):
+        try:
+            if options['path'] == '-':
+                definitions = json.load(sys.stdin)
+            else:
+                with open(options['path'], encoding='utf-8') as schedule_file:
+                    definitions = json.load(schedule_file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Cannot read schedules: {e}')
+        if not isinstance(definitions, list):
+            raise CommandError('Expected a JSON list of schedules')
+
+        serializer = RecurringScheduleSerializer(data=definitions, many=True)
+        if not serializer.is_valid():
+            errors = [f'schedule {index}: {json.dumps(error)}'
+                      for index, error in enumerate(serializer.errors) if error]
+            raise CommandError('Invalid schedules\n' + '\n'.join(errors))
+
+        started = time.perf_counter()
+        created, skipped = import_schedules(serializer.validated_data, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} classes, skipped {skipped} existing in {time.perf_counter() - started:.1f}s'))
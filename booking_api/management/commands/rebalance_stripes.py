@@ -0,0 +1,28 @@
+from django.core.management import BaseCommand, CommandError
+from ...models import FitnessClass
+from ...stripes import rebalance
+
+
+class Command(BaseCommand):
+    help = "Split classes' available slots over striped counters, or change their capacity"
+
+    def add_arguments(self, parser):
+        parser.add_argument('class_ids', nargs='*', type=int, help='Classes to rebalance')
+        parser.add_argument('--all-striped', action='store_true', help='Rebalance every striped class')
+        parser.add_argument('--stripes', type=int, default=None,
+                            help='Number of stripes, 0 turns striping off, defaults to the current number')
+        parser.add_argument('--available', type=int, default=None,
+                            help='New number of available slots, defaults to the current availability')
+
+    def handle(self, *args, **options):
+        classes = FitnessClass.objects.filter(id__in=options['class_ids'])
+        if options['all_striped']:
+            classes = classes | FitnessClass.objects.filter(stripes__gt=0)
+        if not classes.exists():
+            raise CommandError('No classes to rebalance')
+
+        for fitness_class in classes:
+            stripes = fitness_class.stripes if options['stripes'] is None else options['stripes']
+            fitness_class = rebalance(fitness_class, stripes, options['available'])
+            self.stdout.write(self.style.SUCCESS(f'{fitness_class.name} ({fitness_class.id}): '
+                                                 f'{fitness_class.stripes} stripes'))
@@ -0,0 +1,20 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into a replica stand-in with the SQLite backup API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--replica', default='replica', help='Database alias of the replica')
+
+    def handle(self, *args, **options):
+        primary, replica = connections['default'], connections[options['replica']]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError('sync_replica only copies SQLite databases, use real replication for other backends')
+
+        primary.ensure_connection()
+        replica.ensure_connection()
+        primary.connection.backup(replica.connection)
+        self.stdout.write(self.style.SUCCESS(f"Copied {primary.settings_dict['NAME']} "
+                                             f"into {replica.settings_dict['NAME']}"))
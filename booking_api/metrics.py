@@ -0,0 +1,199 @@
+import bisect
+import math
+import threading
+from functools import wraps
+from django.conf import settings
+
+# request latency buckets in seconds, the Prometheus client defaults with a finer low end
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOCK_WAIT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def metrics_enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_labels(labelnames, labelvalues, extra=()):
+    pairs = [*zip(labelnames, labelvalues), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label_value(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    """
+    monotonically increasing count per combination of label values
+
+    name is the exposed name, _total suffix included, so HELP and TYPE match the samples
+    """
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def get(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labelvalues, value in values:
+            yield f'{self.name}{format_labels(self.labelnames, labelvalues)} {format_value(value)}'
+
+
+class Histogram:
+    """
+    observations counted into fixed buckets per combination of label values
+
+    observe() finds the bucket with a bisect and bumps one count; the
+    cumulative le buckets Prometheus expects are only summed up when rendered.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._lock = threading.Lock()
+        # label values: [per bucket counts, sum]
+        self._values = {}
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labelvalues)
+            if series is None:
+                series = self._values[labelvalues] = [[0] * len(self.buckets), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def get_count(self, *labelvalues):
+        series = self._values.get(labelvalues)
+        return sum(series[0]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labelvalues, list(counts), total) for labelvalues, (counts, total) in self._values.items())
+        for labelvalues, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = format_labels(self.labelnames, labelvalues, [('le', format_value(bound))])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = format_labels(self.labelnames, labelvalues)
+            yield f'{self.name}_sum{labels} {format_value(total)}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+class Registry:
+    """
+    the metrics of this process, rendered in the Prometheus text format
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+requests_total = registry.register(Counter(
+    'booking_api_requests_total', 'Requests by view, method and status code', ['view', 'method', 'status']))
+request_duration = registry.register(Histogram(
+    'booking_api_request_duration_seconds', 'Time to build the response, by view', ['view']))
+bookings_total = registry.register(Counter(
+    'booking_api_bookings_total', 'Booking attempts by outcome: created, sold_out, duplicate, invalid or error',
+    ['outcome']))
+booking_lock_wait = registry.register(Histogram(
+    'booking_api_booking_lock_wait_seconds',
+    "Time taking a class's slots: the conditional decrement for single bookings, the row locks for batches",
+    ['path'], buckets=LOCK_WAIT_BUCKETS))
+
+
+def get_view_name(request):
+    """
+    the routed view's class (or function) name, None for requests no view was resolved for
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    func = match.func
+    return getattr(getattr(func, 'view_class', func), '__name__', match.view_name)
+
+
+def record_request(request, response, duration):
+    view = get_view_name(request)
+    if view is None:
+        # unrouted paths would add a series per scanned URL
+        view = 'unresolved'
+    requests_total.inc(view, request.method, str(response.status_code))
+    request_duration.observe(duration, view)
+
+
+def get_booking_outcome(status_code, data):
+    """
+    outcome label of one booking attempt from its response status and body
+    """
+    if status_code == 201:
+        return 'created'
+    if status_code >= 500:
+        return 'error'
+    errors = data.get('error') if isinstance(data, dict) else None
+    errors = errors if isinstance(errors, list) else [errors]
+    if 'No available slots for this class' in errors:
+        return 'sold_out'
+    if 'Booking already exists for this class' in errors:
+        return 'duplicate'
+    return 'invalid'
+
+
+def count_booking_outcomes(post):
+    """
+    count the outcome of every booking a POST /book/ or /book/batch/ response reports
+    """
+
+    @wraps(post)
+    def wrapper(self, request, *args, **kwargs):
+        response = post(self, request, *args, **kwargs)
+        if not metrics_enabled():
+            return response
+        data = response.data
+        if isinstance(data, dict) and isinstance(data.get('results'), list) and response.status_code == 200:
+            # a batch, each item carries its own status
+            for item in data['results']:
+                bookings_total.inc(get_booking_outcome(item['status'], item))
+        else:
+            bookings_total.inc(get_booking_outcome(response.status_code, data))
+        return response
+
+    return wrapper
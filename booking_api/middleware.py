@@ -0,0 +1,171 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import time
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from .instrumentation import QueryTimer, start_timings, stop_timings
+from .metrics import metrics_enabled, record_request
+from .routers import pick_replica, pin_primary, release_replica, unpin_primary
+
+
+logger = logging.getLogger('booking_api.requests')
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Server-Timing header, slow request log and opt-in profiling for every request
+
+    Every request is also counted in the /metrics request metrics (METRICS_ENABLED).
+    Sync requests report the query count and SQL time of every database alias,
+    plus the sections views wrap in instrumentation.timed(). Async requests
+    run their queries in worker threads, so they only report the sections.
+    With REQUEST_PROFILING_ENABLED, ?profile=1 answers with the request's
+    pstats, and also dumps it to REQUEST_PROFILE_DIR when that is set.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if self.is_profiling(request):
+            return self.profile(request)
+
+        query_timer = QueryTimer()
+        timings, token = start_timings()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(query_timer))
+                response = self.get_response(request)
+        finally:
+            stop_timings(token)
+        self.report(request, response, time.perf_counter() - started, timings, query_timer)
+        return response
+
+    async def __acall__(self, request):
+        timings, token = start_timings()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_timings(token)
+        self.report(request, response, time.perf_counter() - started, timings)
+        return response
+
+    def report(self, request, response, total, timings, query_timer=None):
+        if metrics_enabled():
+            record_request(request, response, total)
+
+        metrics = [('total', total)]
+        if query_timer is not None:
+            metrics.append(('db', query_timer.duration))
+        metrics.extend(timings.items())
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={duration * 1000:.2f}' + (f';desc="{query_timer.count} queries"' if name == 'db' else '')
+            for name, duration in metrics)
+
+        if total * 1000 >= getattr(settings, 'REQUEST_SLOW_THRESHOLD_MS', 500):
+            stats = {
+                'method': request.method,
+                # without the query string, it carries client emails
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': round(total * 1000, 2),
+                **{f'{name}_ms': round(duration * 1000, 2) for name, duration in timings.items()},
+            }
+            if query_timer is not None:
+                stats.update(queries=query_timer.count, db_ms=round(query_timer.duration * 1000, 2))
+            logger.warning('slow request %s', json.dumps(stats), extra={'request_stats': stats})
+
+    def is_profiling(self, request):
+        return getattr(settings, 'REQUEST_PROFILING_ENABLED', False) and request.GET.get('profile') == '1'
+
+    def profile(self, request):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            self.get_response(request)
+        finally:
+            profiler.disable()
+
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(50)
+        response = HttpResponse(output.getvalue(), content_type='text/plain')
+
+        profile_dir = getattr(settings, 'REQUEST_PROFILE_DIR', None)
+        if profile_dir:
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{request.path.strip('/').replace('/', '_')}"
+            path = os.path.join(profile_dir, f'{name}-{time.perf_counter_ns()}.prof')
+            profiler.dump_stats(path)
+            response['X-Profile-File'] = path
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    pin reads to the primary for writes and for clients that just wrote, and
+    to a single replica for everything else
+
+    A successful write sets a cookie for REPLICA_STICKY_SECONDS, and requests
+    carrying it read from the primary, so a client that just booked reads its
+    own booking even when the replicas lag behind.
+    """
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'booking_api_primary'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        use_primary = self.use_primary(request)
+        token = pin_primary() if use_primary else pick_replica()
+        try:
+            response = self.get_response(request)
+        finally:
+            if use_primary:
+                unpin_primary(token)
+            else:
+                release_replica(token)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        use_primary = self.use_primary(request)
+        token = pin_primary() if use_primary else pick_replica()
+        try:
+            response = await self.get_response(request)
+        finally:
+            if use_primary:
+                unpin_primary(token)
+            else:
+                release_replica(token)
+        return self.process_response(request, response)
+
+    def use_primary(self, request):
+        return request.method not in ('GET', 'HEAD', 'OPTIONS') or self.cookie_name in request.COOKIES
+
+    def process_response(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            response.set_cookie(self.cookie_name, '1', max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 5),
+                                httponly=True, samesite='Lax')
+        return response
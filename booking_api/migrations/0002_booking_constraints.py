@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(fields=('fitness_class', 'client_email'), name='booking_unique_class_client_email'),
+        ),
+        migrations.AddConstraint(
+            model_name='fitnessclass',
+            constraint=models.CheckConstraint(condition=models.Q(('available_slots__gte', 0)), name='fitnessclass_available_slots_gte_0'),
+        ),
+    ]
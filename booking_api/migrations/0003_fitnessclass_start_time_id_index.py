@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_api', '0002_booking_constraints'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fitnessclass',
+            index=models.Index(fields=['start_time', 'id'], name='fitnessclass_start_time_id'),
+        ),
+    ]
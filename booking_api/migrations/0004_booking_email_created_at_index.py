@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_api', '0003_fitnessclass_start_time_id_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['client_email', 'created_at'], name='booking_email_created_at'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_api', '0004_booking_email_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fitnessclass',
+            name='stripes',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='SlotStripe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe', models.PositiveSmallIntegerField()),
+                ('available_slots', models.PositiveIntegerField()),
+                ('fitness_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_stripes', to='booking_api.fitnessclass')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('fitness_class', 'stripe'), name='slotstripe_unique_class_stripe'), models.CheckConstraint(condition=models.Q(('available_slots__gte', 0)), name='slotstripe_available_slots_gte_0')],
+            },
+        ),
+    ]
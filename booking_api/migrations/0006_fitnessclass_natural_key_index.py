@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_api', '0005_slot_stripes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fitnessclass',
+            index=models.Index(fields=['instructor', 'name', 'start_time'], name='fitnessclass_natural_key'),
+        ),
+    ]
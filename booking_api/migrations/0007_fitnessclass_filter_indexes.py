@@ -0,0 +1,25 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_api', '0006_fitnessclass_natural_key_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fitnessclass',
+            index=models.Index(fields=['instructor', 'start_time', 'id'], name='fitnessclass_instructor_start'),
+        ),
+        migrations.AddIndex(
+            model_name='fitnessclass',
+            index=models.Index(fields=['name', 'start_time', 'id'], name='fitnessclass_name_start'),
+        ),
+        migrations.AddIndex(
+            model_name='fitnessclass',
+            index=models.Index(condition=models.Q(('available_slots__gt', 0), ('stripes__gt', 0), _connector='OR'), fields=['start_time', 'id'], name='fitnessclass_bookable'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_api', '0007_fitnessclass_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedFitnessClass',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100)),
+                ('instructor', models.CharField(max_length=100)),
+                ('start_time', models.DateTimeField()),
+                ('available_slots', models.PositiveIntegerField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('client_name', models.CharField(max_length=100)),
+                ('client_email', models.EmailField(max_length=254)),
+                ('created_at', models.DateTimeField()),
+                ('fitness_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='booking_api.archivedfitnessclass')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['client_email', 'created_at'], name='archivedbooking_email_created')],
+            },
+        ),
+    ]
@@ -1,6 +1,4 @@
 from django.db import models
-from pytz import timezone
-from django.utils.timezone import localtime
 
 
 class FitnessClass(models.Model):
@@ -8,6 +6,27 @@ class FitnessClass(models.Model):
     instructor = models.CharField(max_length=100)
     start_time = models.DateTimeField()
     available_slots = models.PositiveIntegerField()
+    # 0 for a plain class, otherwise availability lives in this many SlotStripe rows
+    # and available_slots is not used (see stripes.py)
+    stripes = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(condition=models.Q(available_slots__gte=0),
+                                   name='fitnessclass_available_slots_gte_0'),
+        ]
+        indexes = [
+            # keyset pagination of the class listing
+            models.Index(fields=['start_time', 'id'], name='fitnessclass_start_time_id'),
+            # /classes/ filters, each an index range scan already in keyset order
+            models.Index(fields=['instructor', 'start_time', 'id'], name='fitnessclass_instructor_start'),
+            models.Index(fields=['name', 'start_time', 'id'], name='fitnessclass_name_start'),
+            models.Index(fields=['start_time', 'id'], name='fitnessclass_bookable',
+                         condition=models.Q(available_slots__gt=0) | models.Q(stripes__gt=0)),
+            # natural key of an occurrence, used by the schedule import to skip existing ones
+            # (not unique, generated sample data may repeat it)
+            models.Index(fields=['instructor', 'name', 'start_time'], name='fitnessclass_natural_key'),
+        ]
 
     def __str__(self):
         return f"{self.name} by {self.instructor} on {self.start_time}"
@@ -19,5 +38,71 @@ class Booking(models.Model):
     client_email = models.EmailField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fitness_class', 'client_email'],
+                                    name='booking_unique_class_client_email'),
+        ]
+        indexes = [
+            # bookings by email, keyset paginated on created_at
+            models.Index(fields=['client_email', 'created_at'], name='booking_email_created_at'),
+        ]
+
     def __str__(self):
         return f"{self.client_name} - {self.fitness_class.name}"
+
+
+class SlotStripe(models.Model):
+    """
+    one share of a hot class's available slots, bookings claim from a random stripe
+    so concurrent bookings for the class update different rows
+    """
+    fitness_class = models.ForeignKey(FitnessClass, on_delete=models.CASCADE, related_name='slot_stripes')
+    stripe = models.PositiveSmallIntegerField()
+    available_slots = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fitness_class', 'stripe'], name='slotstripe_unique_class_stripe'),
+            models.CheckConstraint(condition=models.Q(available_slots__gte=0),
+                                   name='slotstripe_available_slots_gte_0'),
+        ]
+
+    def __str__(self):
+        return f"{self.fitness_class.name} stripe {self.stripe}: {self.available_slots}"
+
+
+class ArchivedFitnessClass(models.Model):
+    """
+    a class moved out of FitnessClass by archive_past, under its original id
+    """
+    id = models.BigIntegerField(primary_key=True)
+    name = models.CharField(max_length=100)
+    instructor = models.CharField(max_length=100)
+    start_time = models.DateTimeField()
+    # the slots left when archived, the stripes summed up for a striped class
+    available_slots = models.PositiveIntegerField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} by {self.instructor} on {self.start_time} (archived)"
+
+
+class ArchivedBooking(models.Model):
+    """
+    a booking of an archived class, under its original id and created_at
+    """
+    id = models.BigIntegerField(primary_key=True)
+    fitness_class = models.ForeignKey(ArchivedFitnessClass, on_delete=models.CASCADE)
+    client_name = models.CharField(max_length=100)
+    client_email = models.EmailField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # same keyset lookup as Booking, for /bookings/?include_archived=true
+            models.Index(fields=['client_email', 'created_at'], name='archivedbooking_email_created'),
+        ]
+
+    def __str__(self):
+        return f"{self.client_name} - {self.fitness_class.name} (archived)"
@@ -0,0 +1,120 @@
+import base64
+import binascii
+import heapq
+from itertools import islice
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward only keyset pagination on (ordering_field, id)
+
+    The cursor holds the last row's ordering value and id, so every page is
+    a range scan on the composite index however deep the client has paged,
+    unlike OFFSET pagination which reads and discards all previous rows.
+    """
+    ordering_field = 'start_time'
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_query_params(self, request):
+        # DRF requests have query_params, plain Django requests (async views) only GET
+        return getattr(request, 'query_params', request.GET)
+
+    def get_page_size(self, request):
+        page_size = getattr(settings, 'API_PAGE_SIZE', 50)
+        max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 200)
+        try:
+            page_size = int(self.get_query_params(request).get(self.page_size_query_param, page_size))
+        except ValueError:
+            pass
+        return max(1, min(page_size, max_page_size))
+
+    def encode_cursor(self, row):
+        # rows are model instances or .values() dicts
+        if isinstance(row, dict):
+            value, pk = row[self.ordering_field], row['id']
+        else:
+            value, pk = getattr(row, self.ordering_field), row.pk
+        value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+        return base64.urlsafe_b64encode(f'{value}|{pk}'.encode()).decode()
+
+    def decode_cursor(self, queryset, cursor):
+        try:
+            value, pk = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+            field = queryset.model._meta.get_field(self.ordering_field)
+            return field.to_python(value), int(pk)
+        except (binascii.Error, UnicodeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(self.ordering_field, 'id')
+        cursor = self.get_query_params(request).get(self.cursor_query_param)
+        if cursor:
+            value, pk = self.decode_cursor(queryset, cursor)
+            queryset = queryset.filter(
+                Q(**{f'{self.ordering_field}__gt': value}) | Q(**{self.ordering_field: value, 'id__gt': pk}))
+
+        # one extra row tells us whether there is a next page without a COUNT(*)
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        page = rows[:self.page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.set_page([row async for row in self.get_page_queryset(queryset, request)])
+
+    def get_row_key(self, row):
+        if isinstance(row, dict):
+            return row[self.ordering_field], row['id']
+        return getattr(row, self.ordering_field), row.pk
+
+    def merge_pages(self, pages):
+        # each page is already in keyset order, so a merge keeps the first page_size + 1 rows overall
+        return self.set_page(list(islice(heapq.merge(*pages, key=self.get_row_key), self.page_size + 1)))
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """
+        one page over several querysets with disjoint ids (e.g. live and archived
+        rows), each read as its own range scan and merged in keyset order
+        """
+        return self.merge_pages([list(self.get_page_queryset(queryset, request)) for queryset in querysets])
+
+    async def apaginate_querysets(self, querysets, request, view=None):
+        return self.merge_pages([[row async for row in self.get_page_queryset(queryset, request)]
+                                 for queryset in querysets])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+
+class BookingKeysetPagination(KeysetPagination):
+    ordering_field = 'created_at'
@@ -0,0 +1,76 @@
+import random
+from contextvars import ContextVar
+from django.conf import settings
+
+
+_use_primary = ContextVar('booking_api_use_primary', default=False)
+_replica = ContextVar('booking_api_replica', default=None)
+
+
+def pin_primary():
+    """
+    send every read of the current request to the primary, returns a token for unpin_primary()
+    """
+    return _use_primary.set(True)
+
+
+def unpin_primary(token):
+    _use_primary.reset(token)
+
+
+def is_primary_pinned():
+    return _use_primary.get()
+
+
+def pick_replica():
+    """
+    send every read of the current request to one replica picked at random, returns a token for release_replica()
+    """
+    replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+    return _replica.set(random.choice(replicas) if replicas else None)
+
+
+def release_replica(token):
+    _replica.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    reads go to a DATABASE_REPLICAS alias, writes to the primary
+
+    A request reads from the one replica pick_replica() chose for it, so its
+    queries see a single replication state; reads outside requests (commands)
+    pick a random replica per query.
+
+    Querysets evaluated for writing (select_for_update(), create(), update())
+    are routed with db_for_write by Django, so they always hit the primary.
+    Requests pinned with pin_primary() (writes, and clients that wrote within
+    REPLICA_STICKY_SECONDS, see ReplicaRoutingMiddleware) read from the primary
+    too, so clients see their own bookings despite replication lag.
+    """
+    primary = 'default'
+
+    def get_replicas(self):
+        return getattr(settings, 'DATABASE_REPLICAS', [])
+
+    def db_for_read(self, model, **hints):
+        replicas = self.get_replicas()
+        if not replicas or _use_primary.get():
+            return self.primary
+        replica = _replica.get()
+        return replica if replica in replicas else random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return self.primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {self.primary, *self.get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema from the primary
+        if db in self.get_replicas():
+            return False
+        return None
@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfoNotFoundError
+from django.db import router, transaction
+from django.utils import timezone
+from rest_framework import serializers
+from .cache import bump_schedule_version
+from .models import FitnessClass
+from .serializers import get_zone
+
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+
+class RecurringScheduleSerializer(serializers.Serializer):
+    """
+    one timetable entry, e.g. Yoga with Alice on mon/wed at 08:00 for 12 weeks
+    """
+    name = serializers.CharField(max_length=100)
+    instructor = serializers.CharField(max_length=100)
+    days = serializers.ListField(child=serializers.ChoiceField(choices=WEEKDAYS), allow_empty=False)
+    time = serializers.TimeField()
+    start_date = serializers.DateField()
+    weeks = serializers.IntegerField(min_value=1, max_value=104, required=False)
+    until = serializers.DateField(required=False)
+    available_slots = serializers.IntegerField(min_value=0)
+    timezone = serializers.CharField(required=False)
+
+    def validate_timezone(self, value):
+        try:
+            get_zone(value)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise serializers.ValidationError('Unknown timezone')
+        return value
+
+    def validate(self, data):
+        if ('weeks' in data) == ('until' in data):
+            raise serializers.ValidationError('Give either weeks or until')
+        if 'until' in data and not data['start_date'] <= data['until'] < data['start_date'] + timedelta(weeks=104):
+            raise serializers.ValidationError('until must be within 104 weeks after start_date')
+        return data
+
+
+def expand_schedule(data):
+    """
+    start times of every occurrence, at the same wall clock time in the schedule's
+    timezone on both sides of a DST change
+    """
+    zone = get_zone(data.get('timezone') or timezone.get_current_timezone_name())
+    last_date = data.get('until') or data['start_date'] + timedelta(weeks=data['weeks'], days=-1)
+    weekdays = {WEEKDAYS.index(day) for day in data['days']}
+    date = data['start_date']
+    while date <= last_date:
+        if date.weekday() in weekdays:
+            yield datetime.combine(date, data['time'], tzinfo=zone)
+        date += timedelta(days=1)
+
+
+def import_schedules(schedules, chunk_size=5000):
+    """
+    create the occurrences of validated schedules, skipping existing ones
+
+    An occurrence exists when a class with the same instructor, name and start
+    time does (the fitnessclass_natural_key index). Each schedule is checked and
+    inserted in one transaction on the primary, chunk_size classes per INSERT.
+    Returns (created, skipped).
+    """
+    created = skipped = 0
+    using = router.db_for_write(FitnessClass)
+
+    for data in schedules:
+        start_times = list(expand_schedule(data))
+        if not start_times:
+            continue
+        with transaction.atomic(using=using):
+            # one index range scan per schedule finds the occurrences already imported,
+            # on the primary as a lagging replica would let them be imported twice
+            seen = set(FitnessClass.objects.using(using).filter(
+                instructor=data['instructor'], name=data['name'],
+                start_time__range=(start_times[0], start_times[-1]),
+            ).values_list('instructor', 'name', 'start_time'))
+
+            pending = []
+            for start_time in start_times:
+                key = (data['instructor'], data['name'], start_time)
+                if key in seen:
+                    skipped += 1
+                    continue
+                seen.add(key)
+                pending.append(FitnessClass(name=data['name'], instructor=data['instructor'], start_time=start_time,
+                                            available_slots=data['available_slots']))
+            FitnessClass.objects.using(using).bulk_create(pending, batch_size=chunk_size)
+        created += len(pending)
+
+    if created:
+        # bulk_create skips the signals that invalidate the cached class listing
+        bump_schedule_version()
+    return created, skipped
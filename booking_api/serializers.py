@@ -1,7 +1,19 @@
 from rest_framework import serializers
-from .models import FitnessClass, Booking
-from django.db import transaction
-from django.utils.timezone import localtime
+from .models import FitnessClass, Booking, ArchivedBooking
+from .cache import bump_schedule_version_on_commit
+from .events import publish_availability_on_commit
+from .metrics import booking_lock_wait, metrics_enabled
+from .stripes import available_slots_expression, claim_slot, get_available_slots, lock_stripes, take_slots
+import copy
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+from time import perf_counter
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.db import IntegrityError, router, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.timezone import is_naive, localtime, make_aware
 
 
 class FitnessClassListSerializer(serializers.ModelSerializer):
@@ -27,6 +39,161 @@ class BookingListSerializer(serializers.ModelSerializer):
         return localtime(obj.created_at).strftime("%Y-%m-%d %H:%M:%S")
 
 
+@lru_cache(maxsize=None)
+def get_zone(name):
+    return ZoneInfo(name)
+
+
+@lru_cache(maxsize=8192)
+def format_datetime(value, tz_name):
+    """
+    same output as localtime(value).strftime("%Y-%m-%d %H:%M:%S") in tz_name,
+    memoized because listings repeat the same start times across many rows
+    """
+    return value.astimezone(get_zone(tz_name)).isoformat(' ', 'seconds')[:19]
+
+
+def get_request_timezone(request):
+    """
+    timezone name from the tz query parameter or X-Timezone header, TIME_ZONE otherwise
+    """
+    params = getattr(request, 'query_params', request.GET)
+    tz_name = params.get('tz') or request.headers.get('X-Timezone')
+    if not tz_name:
+        return timezone.get_current_timezone_name()
+    try:
+        get_zone(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise serializers.ValidationError({"error": "Unknown timezone"})
+    return tz_name
+
+
+def parse_datetime_param(value, tz_name, name, end_of_day=False):
+    """
+    aware datetime from an ISO datetime or date parameter, naive values are taken in tz_name
+
+    a date is its midnight, or the next midnight with end_of_day (for inclusive "to" dates)
+    """
+    parsed = None
+    try:
+        # dates first, parse_datetime also accepts a bare date as its midnight
+        date = parse_date(value)
+        if date is not None:
+            parsed = datetime.combine(date + timedelta(days=end_of_day), time.min)
+        else:
+            parsed = parse_datetime(value)
+    except ValueError:
+        pass
+    if parsed is None:
+        raise serializers.ValidationError({"error": f"Invalid {name}, use YYYY-MM-DD or an ISO datetime"})
+    return make_aware(parsed, get_zone(tz_name)) if is_naive(parsed) else parsed
+
+
+def get_requested_fields(request, allowed):
+    """
+    fields listed in the fields query parameter (sparse fieldset), in allowed order, all of them by default
+    """
+    params = getattr(request, 'query_params', request.GET)
+    requested = [field for field in params.get('fields', '').split(',') if field]
+    if not requested:
+        return allowed
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise serializers.ValidationError({"error": f"Unknown fields: {', '.join(unknown)}"})
+    return tuple(field for field in allowed if field in requested)
+
+
+class FitnessClassProjection:
+    """
+    read only fast path of FitnessClassListSerializer working on .values() rows
+    """
+    fields = ('id', 'name', 'instructor', 'start_time')
+    output_fields = ('id', 'name', 'instructor', 'start_time', 'available_slots')
+
+    def __init__(self, tz_name, fields=None):
+        self.tz_name = tz_name
+        self.sparse = fields is not None and tuple(fields) != self.output_fields
+        if self.sparse:
+            self.output_fields = tuple(fields)
+
+    def get_queryset(self, queryset):
+        if 'available_slots' not in self.output_fields:
+            return queryset.values(*self.fields)
+        # striped classes report the sum of their stripes
+        return queryset.values(*self.fields, slots=available_slots_expression())
+
+    def to_representation(self, rows):
+        for row in rows:
+            row['start_time'] = format_datetime(row['start_time'], self.tz_name)
+            if 'slots' in row:
+                row['available_slots'] = row.pop('slots')
+        if self.sparse:
+            rows = [{field: row[field] for field in self.output_fields} for row in rows]
+        return rows
+
+
+class BookingProjection:
+    """
+    read only fast path of BookingListSerializer working on .values() rows
+
+    with normalize, each booking's fitness_class is the class id and every
+    referenced class is rendered once into self.classes
+    """
+    fields = ('id', 'client_name', 'client_email', 'created_at')
+    class_fields = ('fitness_class_id', 'fitness_class__name', 'fitness_class__instructor',
+                    'fitness_class__start_time')
+    output_fields = ('id', 'fitness_class', 'client_name', 'client_email', 'created_at')
+
+    def __init__(self, tz_name, fields=None, normalize=False):
+        self.tz_name = tz_name
+        self.sparse = fields is not None and tuple(fields) != self.output_fields
+        if self.sparse:
+            self.output_fields = tuple(fields)
+        self.normalize = normalize
+        self.classes = {}
+
+    def get_queryset(self, queryset):
+        if 'fitness_class' not in self.output_fields:
+            # no join with the class table at all
+            return queryset.values(*self.fields)
+        if queryset.model is ArchivedBooking:
+            # archived classes keep their final count, they have no stripes
+            class_slots = F('fitness_class__available_slots')
+        else:
+            class_slots = available_slots_expression('fitness_class__')
+        return queryset.values(*self.fields, *self.class_fields, class_slots=class_slots)
+
+    def get_class(self, row):
+        return {
+            'id': row['fitness_class_id'],
+            'name': row['fitness_class__name'],
+            'instructor': row['fitness_class__instructor'],
+            'start_time': format_datetime(row['fitness_class__start_time'], self.tz_name),
+            'available_slots': row['class_slots'],
+        }
+
+    def get_class_id(self, row):
+        class_id = row['fitness_class_id']
+        if class_id not in self.classes:
+            self.classes[class_id] = self.get_class(row)
+        return class_id
+
+    def to_representation(self, rows):
+        tz_name = self.tz_name
+        with_class = 'fitness_class' in self.output_fields
+        get_class = self.get_class_id if self.normalize else self.get_class
+        results = [{
+            'id': row['id'],
+            'fitness_class': get_class(row) if with_class else None,
+            'client_name': row['client_name'],
+            'client_email': row['client_email'],
+            'created_at': format_datetime(row['created_at'], tz_name),
+        } for row in rows]
+        if self.sparse:
+            results = [{field: booking[field] for field in self.output_fields} for booking in results]
+        return results
+
+
 class CreateBookingSerializer(serializers.ModelSerializer):
     class_id = serializers.PrimaryKeyRelatedField(
         queryset=FitnessClass.objects.all(),
@@ -37,41 +204,60 @@ class CreateBookingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Booking
         fields = ['class_id', 'client_name', 'client_email']
+        # duplicates are rejected by the booking_unique_class_client_email
+        # constraint in create(), not by an extra exists() query here
+        validators = []
 
     def validate(self, data):
         """
-        validate slot availability and duplicate bookings
+        validate slot availability against the already fetched class
         """
 
         fitness_class = data['fitness_class']
-        client_email = data['client_email']
 
-        if fitness_class.available_slots <= 0:
+        # Cheap early rejection, the authoritative check is the conditional update in create()
+        # (striped classes keep their availability in the stripes)
+        if not fitness_class.stripes and fitness_class.available_slots <= 0:
             raise serializers.ValidationError({"error": "No available slots for this class"})
 
-        if Booking.objects.filter(fitness_class=fitness_class, client_email=client_email).exists():
-            raise serializers.ValidationError({"error": "Booking already exists for this class"})
-
         return data
 
     def create(self, validated_data):
         """
         create new booking and decrement available slots
         """
-        with transaction.atomic():
-            fitness_class = FitnessClass.objects.select_for_update().get(
-                id=validated_data['fitness_class'].id)  # select for update means lock the row for update
-
-            # Double-check slots are still availabe (race condition protection)
-            if fitness_class.available_slots <= 0:
-                raise serializers.ValidationError("No available slots for this class")
+        fitness_class = validated_data['fitness_class']
+        try:
+            with transaction.atomic():
+                # Conditional decrement: UPDATE ... WHERE id = ? AND available_slots > 0
+                # so concurrent bookings never overbook and never wait on a row read lock
+                started = perf_counter()
+                if fitness_class.stripes:
+                    updated = claim_slot(fitness_class)
+                else:
+                    updated = FitnessClass.objects.filter(id=fitness_class.id, available_slots__gt=0).update(
+                        available_slots=F('available_slots') - 1)
+                if metrics_enabled():
+                    # the decrement waits for the class row (or stripe) lock held by concurrent bookings
+                    booking_lock_wait.observe(perf_counter() - started, 'single')
+                if not updated:
+                    raise serializers.ValidationError({"error": ["No available slots for this class"]})
+                bump_schedule_version_on_commit()
+                publish_availability_on_commit(fitness_class.id)
 
-            # Create the booking
-            booking = super().create(validated_data)
+                # Create the booking, the unique constraint rolls back the decrement on duplicates
+                booking = super().create(validated_data)
+        except IntegrityError:
+            # only a booking_unique_class_client_email violation is a duplicate, other failures are not masked
+            if not Booking.objects.using(router.db_for_write(Booking)).filter(
+                    fitness_class_id=fitness_class.id, client_email=validated_data['client_email']).exists():
+                raise
+            raise serializers.ValidationError({"error": ["Booking already exists for this class"]})
 
-            # Decrement available slots
+        if fitness_class.stripes:
+            fitness_class.available_slots = get_available_slots(fitness_class, using=router.db_for_write(FitnessClass))
+        else:
             fitness_class.available_slots -= 1
-            fitness_class.save()
         return booking
 
     def to_representation(self, instance):
@@ -93,3 +279,98 @@ class CreateBookingSerializer(serializers.ModelSerializer):
         }
 
         return representation
+
+
+class PrefetchedClassField(serializers.PrimaryKeyRelatedField):
+    """
+    class_id field resolved from classes fetched once per batch (context['classes'])
+    """
+
+    def to_internal_value(self, data):
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        fitness_class = self.context['classes'].get(pk)
+        if fitness_class is None:
+            self.fail('does_not_exist', pk_value=data)
+        return fitness_class
+
+
+class BatchBookingItemSerializer(CreateBookingSerializer):
+    class_id = PrefetchedClassField(
+        queryset=FitnessClass.objects.all(),
+        source='fitness_class',
+        write_only=True,
+    )
+
+
+def create_class_bookings(fitness_class, items):
+    """
+    book validated items for one class in a single transaction
+
+    items is a list of (index, validated_data) in request order, returns
+    {index: (booking, None) or (None, error)} with the same outcome the
+    single booking path would give when the items are booked one by one
+    """
+    results = {}
+    # every query of the transaction, reads included, runs on the primary
+    using = router.db_for_write(Booking)
+    try:
+        with transaction.atomic(using=using):
+            # one row lock for the whole group instead of one per booking
+            started = perf_counter()
+            if fitness_class.stripes:
+                stripes = lock_stripes(fitness_class, using)
+                available_slots = sum(slots for _, slots in stripes)
+            else:
+                available_slots = FitnessClass.objects.using(using).select_for_update().values_list(
+                    'available_slots', flat=True).get(id=fitness_class.id)
+            if metrics_enabled():
+                booking_lock_wait.observe(perf_counter() - started, 'batch')
+            booked_emails = set(Booking.objects.using(using).filter(
+                fitness_class=fitness_class,
+                client_email__in=[data['client_email'] for _, data in items],
+            ).values_list('client_email', flat=True))
+
+            accepted = []
+            for index, data in items:
+                if available_slots <= 0:
+                    results[index] = (None, {"error": ["No available slots for this class"]})
+                elif data['client_email'] in booked_emails:
+                    results[index] = (None, {"error": ["Booking already exists for this class"]})
+                else:
+                    booked_emails.add(data['client_email'])
+                    available_slots -= 1
+                    accepted.append((index, Booking(**data)))
+
+            if accepted:
+                Booking.objects.using(using).bulk_create([booking for _, booking in accepted])
+                if fitness_class.stripes:
+                    take_slots(stripes, len(accepted), using)
+                else:
+                    FitnessClass.objects.using(using).filter(id=fitness_class.id).update(
+                        available_slots=F('available_slots') - len(accepted))
+                bump_schedule_version_on_commit(using=using)
+                publish_availability_on_commit(fitness_class.id, using=using)
+    except IntegrityError:
+        # lost a race with a concurrent booking, replay the group through the single booking path
+        results = {}
+        for index, data in items:
+            serializer = CreateBookingSerializer()
+            try:
+                results[index] = (serializer.create(dict(data)), None)
+            except serializers.ValidationError as e:
+                results[index] = (None, e.detail)
+        return results
+
+    # every booking reports the slots left right after it, as in the single booking path
+    remaining = available_slots + len(accepted)
+    for index, booking in accepted:
+        remaining -= 1
+        booking.fitness_class = copy.copy(fitness_class)
+        booking.fitness_class.available_slots = remaining
+        results[index] = (booking, None)
+    return results
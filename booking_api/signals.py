@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cache import bump_capacity_version_on_commit, bump_schedule_version_on_commit
+from .events import publish_availability_on_commit
+from .models import FitnessClass
+
+
+@receiver(post_save, sender=FitnessClass)
+@receiver(post_delete, sender=FitnessClass)
+def invalidate_class_listing(sender, instance, using, **kwargs):
+    bump_schedule_version_on_commit(using=using)
+    # capacity edits and deletions reach the availability streams too
+    publish_availability_on_commit(instance.id, using=using)
+
+
+@receiver(post_save, sender=FitnessClass)
+def reopen_admission(sender, instance, using, **kwargs):
+    # a capacity edit may have added slots to a class the admission queues of every worker saw sold out
+    bump_capacity_version_on_commit(instance.id, using=using)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
@@ -0,0 +1,97 @@
+import random
+from django.db import router, transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, When
+from .cache import bump_capacity_version_on_commit, bump_schedule_version_on_commit
+from .events import publish_availability_on_commit
+from .models import FitnessClass, SlotStripe
+
+
+def available_slots_expression(prefix=''):
+    """
+    a class's available slots: its own column, or the sum of its stripes when striped
+
+    prefix is the lookup path to the class, e.g. 'fitness_class__' from Booking.
+    The subquery only runs for striped classes.
+    """
+    stripe_total = SlotStripe.objects.filter(fitness_class=OuterRef(f'{prefix}id')).values(
+        'fitness_class').annotate(total=Sum('available_slots')).values('total')
+    return Case(
+        When(**{f'{prefix}stripes': 0}, then=F(f'{prefix}available_slots')),
+        default=Subquery(stripe_total),
+    )
+
+
+def claim_slot(fitness_class, using=None):
+    """
+    take one slot from a random non-empty stripe, trying the others when it is empty
+
+    Each attempt is a conditional UPDATE on a single stripe row, so concurrent
+    bookings for the class contend on different rows. Returns False when every
+    stripe is empty.
+    """
+    stripes = SlotStripe.objects.using(using).filter(fitness_class_id=fitness_class.id)
+    order = list(range(fitness_class.stripes))
+    random.shuffle(order)
+    for stripe in order:
+        if stripes.filter(stripe=stripe, available_slots__gt=0).update(available_slots=F('available_slots') - 1):
+            return True
+    return False
+
+
+def get_available_slots(fitness_class, using=None):
+    if not fitness_class.stripes:
+        return fitness_class.available_slots
+    stripes = SlotStripe.objects.using(using).filter(fitness_class_id=fitness_class.id)
+    return stripes.aggregate(total=Sum('available_slots'))['total'] or 0
+
+
+def lock_stripes(fitness_class, using):
+    """
+    lock a striped class's stripes for a batch, returns [(stripe id, available slots)]
+    """
+    return list(SlotStripe.objects.using(using).select_for_update().filter(
+        fitness_class_id=fitness_class.id).order_by('stripe').values_list('id', 'available_slots'))
+
+
+def take_slots(stripes, count, using):
+    """
+    take count slots from stripes locked with lock_stripes()
+    """
+    for stripe_id, available_slots in stripes:
+        taken = min(available_slots, count)
+        if taken:
+            SlotStripe.objects.using(using).filter(id=stripe_id).update(available_slots=F('available_slots') - taken)
+            count -= taken
+        if not count:
+            break
+
+
+def rebalance(fitness_class, stripes, available_slots=None):
+    """
+    split a class's availability evenly over `stripes` stripes, 0 turns striping off
+
+    The current availability (summed over the old stripes) is kept unless
+    available_slots is given, which is how capacity edits are applied to
+    striped classes.
+    """
+    using = router.db_for_write(FitnessClass)
+    with transaction.atomic(using=using):
+        fitness_class = FitnessClass.objects.using(using).select_for_update().get(id=fitness_class.id)
+        old_stripes = SlotStripe.objects.using(using).select_for_update().filter(fitness_class=fitness_class)
+        if available_slots is None:
+            available_slots = get_available_slots(fitness_class, using=using)
+        old_stripes.delete()
+
+        share, remainder = divmod(available_slots, stripes) if stripes else (0, 0)
+        SlotStripe.objects.using(using).bulk_create([
+            SlotStripe(fitness_class=fitness_class, stripe=stripe, available_slots=share + (stripe < remainder))
+            for stripe in range(stripes)
+        ])
+        # the class row keeps the total only while it is not striped
+        FitnessClass.objects.using(using).filter(id=fitness_class.id).update(
+            stripes=stripes, available_slots=0 if stripes else available_slots)
+        bump_schedule_version_on_commit(using=using)
+        publish_availability_on_commit(fitness_class.id, using=using)
+        # update() sends no post_save, reopen the class in every worker's admission queue like reopen_admission does
+        bump_capacity_version_on_commit(fitness_class.id, using=using)
+    return FitnessClass.objects.using(using).get(id=fitness_class.id)
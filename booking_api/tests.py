@@ -1,15 +1,58 @@
-from rest_framework.test import APITestCase
-from .models import FitnessClass, Booking
-from datetime import datetime
-from django.utils.timezone import make_aware
+from rest_framework.test import APITestCase, APIClient, APIRequestFactory
+from .models import FitnessClass, Booking, SlotStripe, ArchivedFitnessClass, ArchivedBooking
+from .admission import AdmissionQueue, admission_queue
+from .cache import get_cache_stats, reset_cache_stats
+from .stripes import rebalance
+from .renderers import FastJSONRenderer
+from .idempotency import get_fingerprint
+from .throttling import TokenBucketThrottle
+from .archive import archive_past
+from .routers import pick_replica, release_replica
+from .schedules import RecurringScheduleSerializer, import_schedules
+from .serializers import CreateBookingSerializer
+from .availability import slot_snapshot
+from .events import CacheBroker
+from .metrics import Histogram, booking_lock_wait, bookings_total, request_duration, requests_total
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.renderers import JSONRenderer
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from datetime import datetime, timedelta
+from asgiref.sync import async_to_sync, sync_to_async
+import asyncio
+from contextlib import aclosing
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+from io import StringIO
+import csv
+import json
+import logging
+import os
+import tempfile
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, QuerySet
+from django.utils.timezone import make_aware, now
 from django.urls import reverse
-from django.test import override_settings
-from pytz import timezone
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest import addModuleCleanup
+from unittest.mock import Mock, patch
+from zoneinfo import ZoneInfo
+
+
+def setUpModule():
+    # the stress tests' slow requests would flood the output, assertLogs still captures the log
+    logger = logging.getLogger('booking_api.requests')
+    addModuleCleanup(logger.setLevel, logger.level)
+    logger.setLevel(logging.ERROR)
 
 
 def get_time_in_timezone(time, tz_str):
 
-    return time.astimezone(timezone(tz_str)).strftime("%Y-%m-%d %H:%M:%S")
+    return time.astimezone(ZoneInfo(tz_str)).strftime("%Y-%m-%d %H:%M:%S")
 
 
 class BookingTestCase(APITestCase):
@@ -19,6 +62,7 @@ class BookingTestCase(APITestCase):
         """
         Set up test data
         """
+        cache.clear()
         self.time1 = make_aware(datetime(2026, 6, 15, 8, 0))
         self.time2 = make_aware(datetime(2026, 6, 15, 10, 0))
         self.time3 = make_aware(datetime(2026, 6, 16, 7, 0))
@@ -36,10 +80,10 @@ class BookingTestCase(APITestCase):
         url = reverse('classes')
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 3)
-        self.assertEqual(response.data[0]['name'], 'Yoga')
-        self.assertEqual(response.data[1]['name'], 'Zumba')
-        self.assertEqual(response.data[2]['name'], 'HIIT')
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(response.data['results'][0]['name'], 'Yoga')
+        self.assertEqual(response.data['results'][1]['name'], 'Zumba')
+        self.assertEqual(response.data['results'][2]['name'], 'HIIT')
 
     def test_get_classes_with_timezone(self):
         """
@@ -53,9 +97,9 @@ class BookingTestCase(APITestCase):
                 converted_time1 = get_time_in_timezone(self.class1.start_time, TIME_ZONE)
                 converted_time2 = get_time_in_timezone(self.class2.start_time, TIME_ZONE)
                 converted_time3 = get_time_in_timezone(self.class3.start_time, TIME_ZONE)
-                self.assertEqual(response.data[0]['start_time'], converted_time1)
-                self.assertEqual(response.data[1]['start_time'], converted_time2)
-                self.assertEqual(response.data[2]['start_time'], converted_time3)
+                self.assertEqual(response.data['results'][0]['start_time'], converted_time1)
+                self.assertEqual(response.data['results'][1]['start_time'], converted_time2)
+                self.assertEqual(response.data['results'][2]['start_time'], converted_time3)
 
     def test_booking_success(self):
         """
@@ -100,6 +144,20 @@ class BookingTestCase(APITestCase):
             'Booking already exists for this class', response.data['error'],
         )
 
+    def test_booking_other_integrity_error_not_masked(self):
+        """
+        Test that constraint failures other than a duplicate booking are not reported as duplicates
+        """
+        serializer = CreateBookingSerializer(data={'class_id': self.class1.id, 'client_name': 'John Doe',
+                                                   'client_email': 'jDw0B@example.com'})
+        serializer.is_valid(raise_exception=True)
+        error = IntegrityError('NOT NULL constraint failed: booking_api_booking.client_name')
+        with patch('rest_framework.serializers.ModelSerializer.create', side_effect=error):
+            with self.assertRaisesMessage(IntegrityError, 'NOT NULL constraint failed'):
+                serializer.save()
+        self.class1.refresh_from_db()
+        self.assertEqual(self.class1.available_slots, 5)
+
     def test_booking_failure_no_available_slots(self):
         """
         Test that booking fails when there are no available slots
@@ -130,3 +188,1892 @@ class BookingTestCase(APITestCase):
             response.data['class_id'][0],
             'Invalid pk "999" - object does not exist.'
         )
+
+
+# many simulated clients share the test client's IP, far above the book_ip rate
+@override_settings(BOOKING_THROTTLE_RATES={})
+class ConcurrentBookingTestCase(TransactionTestCase):
+    THREADS = 20
+
+    def setUp(self):
+        """
+        Set up a single class with fewer slots than competing clients
+        """
+        self.fitness_class = FitnessClass.objects.create(name="Spin", instructor="Dana",
+                                                         start_time=now() + timedelta(days=1), available_slots=5)
+
+    def book(self, client_email):
+        url = reverse('book')
+        data = {'class_id': self.fitness_class.id, 'client_name': 'Client', 'client_email': client_email}
+        try:
+            return APIClient().post(url, data).status_code
+        finally:
+            connection.close()
+
+    def test_concurrent_bookings_do_not_overbook(self):
+        """
+        Test that many simultaneous bookings never exceed the class capacity
+        """
+        barrier = Barrier(self.THREADS)
+
+        def book_after_barrier(i):
+            barrier.wait()
+            return self.book(f'client{i}@example.com')
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            statuses = list(executor.map(book_after_barrier, range(self.THREADS)))
+
+        self.fitness_class.refresh_from_db()
+        booked = Booking.objects.filter(fitness_class=self.fitness_class).count()
+        self.assertEqual(statuses.count(201), booked)
+        self.assertEqual(statuses.count(400), self.THREADS - 5)
+        self.assertEqual(booked, 5)
+        self.assertEqual(self.fitness_class.available_slots, 0)
+
+    def test_concurrent_duplicate_bookings(self):
+        """
+        Test that simultaneous bookings with the same email create a single booking
+        """
+        barrier = Barrier(self.THREADS)
+
+        def book_after_barrier(i):
+            barrier.wait()
+            return self.book('same@example.com')
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            statuses = list(executor.map(book_after_barrier, range(self.THREADS)))
+
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(statuses.count(201), 1)
+        self.assertEqual(Booking.objects.filter(fitness_class=self.fitness_class).count(), 1)
+        self.assertEqual(self.fitness_class.available_slots, 4)
+
+    def test_booking_query_count(self):
+        """
+        Test that a booking costs a class lookup, one conditional update and one insert
+        """
+        url = reverse('book')
+        data = {'class_id': self.fitness_class.id, 'client_name': 'Client', 'client_email': 'q@example.com'}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 201)
+        statements = [q['sql'] for q in queries.captured_queries
+                      if not q['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'BEGIN', 'COMMIT'))]
+        self.assertEqual(len(statements), 3)
+        self.assertFalse(any('FOR UPDATE' in sql for sql in statements))
+
+
+class BatchBookingTestCase(APITestCase):
+    def setUp(self):
+        """
+        Set up classes with small capacities
+        """
+        cache.clear()
+        start_time = now() + timedelta(days=1)
+        self.class1 = FitnessClass.objects.create(name="Yoga", instructor="Alice", start_time=start_time,
+                                                  available_slots=2)
+        self.class2 = FitnessClass.objects.create(name="Zumba", instructor="Bob", start_time=start_time,
+                                                  available_slots=5)
+        Booking.objects.create(fitness_class=self.class2, client_name='Jane', client_email='jane@example.com')
+
+    def batch_items(self):
+        return [
+            {'class_id': self.class1.id, 'client_name': 'A', 'client_email': 'a@example.com'},
+            {'class_id': self.class2.id, 'client_name': 'Jane', 'client_email': 'jane@example.com'},
+            {'class_id': self.class1.id, 'client_name': 'B', 'client_email': 'b@example.com'},
+            {'class_id': self.class1.id, 'client_name': 'A', 'client_email': 'a@example.com'},
+            {'class_id': self.class1.id, 'client_name': 'C', 'client_email': 'c@example.com'},
+            {'class_id': 999, 'client_name': 'D', 'client_email': 'd@example.com'},
+            {'class_id': self.class2.id, 'client_name': 'E'},
+            {'class_id': self.class2.id, 'client_name': 'F', 'client_email': 'not-an-email'},
+            {'class_id': self.class2.id, 'client_name': 'G', 'client_email': 'g@example.com'},
+        ]
+
+    def test_batch_booking(self):
+        """
+        Test that a batch books every valid item and decrements slots once per class
+        """
+        url = reverse('book-batch')
+        response = self.client.post(url, self.batch_items(), format='json')
+        self.assertEqual(response.status_code, 200)
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses, [201, 400, 201, 400, 400, 400, 400, 400, 201])
+        self.class1.refresh_from_db()
+        self.class2.refresh_from_db()
+        self.assertEqual(self.class1.available_slots, 0)
+        self.assertEqual(self.class2.available_slots, 4)
+        self.assertEqual(Booking.objects.count(), 4)
+
+    def test_batch_matches_single_bookings(self):
+        """
+        Test that each batch item gets the same outcome as booking it through /book/
+        """
+        response = self.client.post(reverse('book-batch'), self.batch_items(), format='json')
+        batch_results = response.data['results']
+
+        Booking.objects.exclude(client_email='jane@example.com').delete()
+        FitnessClass.objects.filter(id=self.class1.id).update(available_slots=2)
+        FitnessClass.objects.filter(id=self.class2.id).update(available_slots=5)
+
+        for item, batch_result in zip(self.batch_items(), batch_results):
+            single = self.client.post(reverse('book'), item, format='json')
+            expected = {"status": single.status_code, **single.data}
+            # booking ids differ between the two runs
+            for result in (batch_result, expected):
+                result.get('booking', {}).pop('booking_id', None)
+            self.assertEqual(batch_result, expected)
+
+    def test_batch_booking_query_count(self):
+        """
+        Test that the query count depends on the number of classes, not bookings
+        """
+        items = [{'class_id': self.class2.id, 'client_name': 'Client', 'client_email': f'c{i}@example.com'}
+                 for i in range(4)]
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(reverse('book-batch'), items[:1], format='json')
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(reverse('book-batch'), items[1:], format='json')
+        self.assertEqual(len(small), len(large))
+
+    def test_batch_booking_invalid_payload(self):
+        """
+        Test that a batch must be a non-empty list
+        """
+        url = reverse('book-batch')
+        response = self.client.post(url, {'class_id': self.class1.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Expected a list of bookings')
+
+
+class ClassPaginationTestCase(APITestCase):
+    def setUp(self):
+        """
+        Set up classes where several share a start time
+        """
+        cache.clear()
+        start_time = now() + timedelta(days=1)
+        FitnessClass.objects.bulk_create([
+            FitnessClass(name=f"Class {i}", instructor="Alice", start_time=start_time + timedelta(hours=i // 3),
+                         available_slots=5)
+            for i in range(10)
+        ])
+
+    def test_pages_cover_every_class_once(self):
+        """
+        Test that following next links returns every class once, in (start_time, id) order
+        """
+        url = reverse('classes') + '?page_size=4'
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 4)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        expected = list(FitnessClass.objects.order_by('start_time', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    @override_settings(API_MAX_PAGE_SIZE=3)
+    def test_page_size_is_capped(self):
+        """
+        Test that page_size cannot exceed the configured maximum
+        """
+        response = self.client.get(reverse('classes') + '?page_size=1000')
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_invalid_cursor(self):
+        """
+        Test that a malformed cursor is rejected
+        """
+        response = self.client.get(reverse('classes') + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_deep_page_uses_index(self):
+        """
+        Test that a deep page is an index range scan without OFFSET
+        """
+        first = self.client.get(reverse('classes') + '?page_size=8')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first.data['next'])
+        sql = queries.captured_queries[-1]['sql']
+        self.assertNotIn('OFFSET', sql)
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('fitnessclass_start_time_id', plan)
+
+
+class BookingListTestCase(APITestCase):
+    def setUp(self):
+        """
+        Set up one upcoming and one past class
+        """
+        self.upcoming_class = FitnessClass.objects.create(name="Yoga", instructor="Alice",
+                                                          start_time=now() + timedelta(days=1), available_slots=50)
+        self.past_class = FitnessClass.objects.create(name="Zumba", instructor="Bob",
+                                                      start_time=now() - timedelta(days=1), available_slots=50)
+
+    def create_bookings(self, count, email='client@example.com'):
+        for i in range(count):
+            fitness_class = FitnessClass.objects.create(name=f"Class {i}", instructor="Alice",
+                                                        start_time=now() + timedelta(days=2), available_slots=5)
+            Booking.objects.create(fitness_class=fitness_class, client_name='Client', client_email=email)
+
+    def test_get_bookings(self):
+        """
+        Test that bookings are listed for the given email only
+        """
+        Booking.objects.create(fitness_class=self.upcoming_class, client_name='A', client_email='a@example.com')
+        Booking.objects.create(fitness_class=self.upcoming_class, client_name='B', client_email='b@example.com')
+        response = self.client.get(reverse('bookings'), {'email': 'a@example.com'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['fitness_class']['name'], 'Yoga')
+
+    def test_get_bookings_missing_email(self):
+        """
+        Test that the email query parameter is required
+        """
+        response = self.client.get(reverse('bookings'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Email is required')
+
+    def test_get_bookings_upcoming_and_past(self):
+        """
+        Test the upcoming and past filters
+        """
+        Booking.objects.create(fitness_class=self.upcoming_class, client_name='A', client_email='a@example.com')
+        Booking.objects.create(fitness_class=self.past_class, client_name='A', client_email='a@example.com')
+        url = reverse('bookings')
+        upcoming = self.client.get(url, {'email': 'a@example.com', 'upcoming': 'true'})
+        past = self.client.get(url, {'email': 'a@example.com', 'past': 'true'})
+        self.assertEqual([b['fitness_class']['name'] for b in upcoming.data['results']], ['Yoga'])
+        self.assertEqual([b['fitness_class']['name'] for b in past.data['results']], ['Zumba'])
+        both = self.client.get(url, {'email': 'a@example.com', 'upcoming': 'true', 'past': 'true'})
+        self.assertEqual(both.status_code, 400)
+
+    def test_get_bookings_query_count_is_constant(self):
+        """
+        Test that listing bookings does not issue a query per booking
+        """
+        url = reverse('bookings')
+        self.create_bookings(1, email='one@example.com')
+        self.create_bookings(30, email='many@example.com')
+        with CaptureQueriesContext(connection) as one:
+            self.client.get(url, {'email': 'one@example.com'})
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url, {'email': 'many@example.com'})
+        self.assertEqual(len(response.data['results']), 30)
+        self.assertEqual(len(one), len(many))
+        self.assertEqual(len(many), 1)
+
+    def test_get_bookings_uses_email_index(self):
+        """
+        Test that the email lookup is backed by the (client_email, created_at) index
+        """
+        self.create_bookings(3)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('bookings'), {'email': 'client@example.com'})
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {queries.captured_queries[-1]['sql']}")
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('booking_email_created_at', plan)
+
+
+class ClassListingCacheTestCase(APITestCase):
+    def setUp(self):
+        """
+        Set up an upcoming class with an empty cache
+        """
+        cache.clear()
+        reset_cache_stats()
+        self.fitness_class = FitnessClass.objects.create(name="Yoga", instructor="Alice",
+                                                         start_time=now() + timedelta(days=1), available_slots=5)
+
+    def test_cached_listing_skips_database(self):
+        """
+        Test that a repeated listing is served from the cache without queries
+        """
+        url = reverse('classes')
+        first = self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+        stats = get_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_not_modified(self):
+        """
+        Test that a matching If-None-Match gets a 304 without queries
+        """
+        url = reverse('classes')
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(get_cache_stats()['not_modified'], 1)
+
+    def test_booking_invalidates_listing(self):
+        """
+        Test that a booking changes the ETag and the cached available slots
+        """
+        url = reverse('classes')
+        etag = self.client.get(url)['ETag']
+        data = {'class_id': self.fitness_class.id, 'client_name': 'John Doe', 'client_email': 'john@example.com'}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('book'), data)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'][0]['available_slots'], 4)
+
+    def test_class_save_invalidates_listing(self):
+        """
+        Test that editing a class changes the cached listing
+        """
+        url = reverse('classes')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fitness_class.name = "Power Yoga"
+            self.fitness_class.save()
+        response = self.client.get(url)
+        self.assertEqual(response.data['results'][0]['name'], 'Power Yoga')
+
+    def test_cache_stats(self):
+        """
+        Test that the cache stats endpoint reports the hit rate
+        """
+        url = reverse('classes')
+        self.client.get(url)
+        self.client.get(url)
+        response = self.client.get(reverse('classes-cache-stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['hit_rate'], 0.5)
+
+
+class ProjectionTestCase(APITestCase):
+    def setUp(self):
+        """
+        Set up classes and bookings with an empty cache
+        """
+        cache.clear()
+        start_time = now() + timedelta(days=1)
+        self.classes = [
+            FitnessClass.objects.create(name=f"Class {i}", instructor="Alice",
+                                        start_time=start_time + timedelta(minutes=37 * i), available_slots=5)
+            for i in range(3)
+        ]
+        for fitness_class in self.classes:
+            Booking.objects.create(fitness_class=fitness_class, client_name='A', client_email='a@example.com')
+
+    def test_projection_matches_serializers(self):
+        """
+        Test that the fast path renders the same payload as the model serializers
+        """
+        from .serializers import FitnessClassListSerializer, BookingListSerializer
+
+        classes = self.client.get(reverse('classes')).data['results']
+        expected = FitnessClassListSerializer(FitnessClass.objects.order_by('start_time', 'id'), many=True).data
+        self.assertEqual(classes, expected)
+
+        bookings = self.client.get(reverse('bookings'), {'email': 'a@example.com'}).data['results']
+        expected = BookingListSerializer(Booking.objects.order_by('created_at', 'id'), many=True).data
+        self.assertEqual(bookings, expected)
+
+    def test_per_request_timezone(self):
+        """
+        Test that the tz query parameter and X-Timezone header pick the rendering timezone
+        """
+        start_time = self.classes[0].start_time
+        for tz_name in ['America/New_York', 'Asia/Kolkata', 'UTC']:
+            response = self.client.get(reverse('classes'), {'tz': tz_name})
+            self.assertEqual(response.data['results'][0]['start_time'], get_time_in_timezone(start_time, tz_name))
+            response = self.client.get(reverse('bookings'), {'email': 'a@example.com'}, HTTP_X_TIMEZONE=tz_name)
+            self.assertEqual(response.data['results'][0]['fitness_class']['start_time'],
+                             get_time_in_timezone(start_time, tz_name))
+
+    def test_unknown_timezone(self):
+        """
+        Test that an unknown timezone is rejected
+        """
+        response = self.client.get(reverse('classes'), {'tz': 'Mars/Olympus_Mons'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Unknown timezone')
+
+
+class AsyncReadViewTestCase(APITestCase):
+    def setUp(self):
+        """
+        Set up classes and bookings with an empty cache
+        """
+        cache.clear()
+        start_time = now() + timedelta(days=1)
+        for i in range(5):
+            fitness_class = FitnessClass.objects.create(name=f"Class {i}", instructor="Alice",
+                                                        start_time=start_time + timedelta(hours=i), available_slots=5)
+            Booking.objects.create(fitness_class=fitness_class, client_name='A', client_email='a@example.com')
+
+    async def test_async_classes_match_sync(self):
+        """
+        Test that the async class listing, served through ASGI, matches the sync view page by page
+        """
+        url, async_url = reverse('classes'), reverse('async-classes')
+        query = '?page_size=2&tz=America/New_York'
+        while query:
+            response = await self.async_client.get(async_url + query)
+            self.assertEqual(response.status_code, 200)
+            expected = await self.sync_get(url + query)
+            payload = response.json()
+            self.assertEqual(payload['results'], expected['results'])
+            query = '?' + payload['next'].split('?', 1)[1] if payload['next'] else None
+
+    async def test_async_not_modified(self):
+        """
+        Test that the async class listing answers If-None-Match with 304
+        """
+        url = reverse('async-classes')
+        etag = (await self.async_client.get(url))['ETag']
+        response = await self.async_client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_async_bookings_match_sync(self):
+        """
+        Test that the async bookings listing matches the sync view
+        """
+        response = await self.async_client.get(reverse('async-bookings'), {'email': 'a@example.com'})
+        self.assertEqual(response.status_code, 200)
+        expected = await self.sync_get(reverse('bookings') + '?email=a@example.com')
+        self.assertEqual(response.json()['results'], expected['results'])
+
+    async def test_async_bookings_missing_email(self):
+        """
+        Test that the async bookings listing requires an email
+        """
+        response = await self.async_client.get(reverse('async-bookings'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Email is required')
+
+    async def sync_get(self, url):
+        response = await sync_to_async(self.client.get)(url)
+        return response.json()
+
+
+@override_settings(BOOKING_ADMISSION_QUEUE=True)
+# many simulated clients share the test client's IP, far above the book_ip rate
+@override_settings(BOOKING_THROTTLE_RATES={})
+class AdmissionQueueTestCase(TransactionTestCase):
+    THREADS = 30
+
+    def setUp(self):
+        """
+        Set up a single class with fewer slots than competing clients
+        """
+        admission_queue._sold_out.clear()
+        self.fitness_class = FitnessClass.objects.create(name="Spin", instructor="Dana",
+                                                         start_time=now() + timedelta(days=1), available_slots=10)
+
+    def book(self, client_email):
+        url = reverse('book')
+        data = {'class_id': self.fitness_class.id, 'client_name': 'Client', 'client_email': client_email}
+        try:
+            return APIClient().post(url, data)
+        finally:
+            connection.close()
+
+    def test_admission_does_not_overbook(self):
+        """
+        Test that queued bookings, including duplicates, never exceed the class capacity
+        """
+        barrier = Barrier(self.THREADS)
+
+        def book_after_barrier(i):
+            barrier.wait()
+            return self.book(f'client{i % 25}@example.com').status_code
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            statuses = list(executor.map(book_after_barrier, range(self.THREADS)))
+
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(statuses.count(201), 10)
+        self.assertEqual(Booking.objects.filter(fitness_class=self.fitness_class).count(), 10)
+        self.assertEqual(self.fitness_class.available_slots, 0)
+
+    def test_admission_booking_response(self):
+        """
+        Test that a queued booking gets the same response as a direct one
+        """
+        response = self.book('john@example.com')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['message'], 'Booking created successfully')
+        self.assertEqual(response.data['booking']['fitness_class']['available_slots'], 9)
+        duplicate = self.book('john@example.com')
+        self.assertEqual(duplicate.status_code, 400)
+        self.assertIn('Booking already exists for this class', duplicate.data['error'])
+
+    def test_sold_out_rejected_without_queries(self):
+        """
+        Test that once a class is seen sold out, bookings are rejected without queries
+        """
+        FitnessClass.objects.filter(id=self.fitness_class.id).update(available_slots=1)
+        self.book('first@example.com')
+        self.assertEqual(self.book('second@example.com').status_code, 400)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('book'), {'class_id': self.fitness_class.id, 'client_name': 'C',
+                                                          'client_email': 'third@example.com'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('No available slots for this class', response.data['error'])
+        self.assertEqual(len(queries), 0)
+
+        # editing the class reopens it, by moving its capacity version rather than clearing this worker's mark
+        self.fitness_class.refresh_from_db()
+        self.fitness_class.available_slots = 5
+        self.fitness_class.save()
+        self.assertIn(self.fitness_class.id, admission_queue._sold_out)
+        self.assertEqual(self.book('third@example.com').status_code, 201)
+
+    def test_capacity_edit_reopens_every_worker(self):
+        """
+        Test that a capacity edit outdates the sold out marks of every worker's queue, not only its own
+        """
+        class_id = self.fitness_class.id
+        workers = [AdmissionQueue(), AdmissionQueue()]
+        for worker in workers:
+            worker.mark_sold_out(class_id, worker.get_capacity_version(class_id))
+            self.assertTrue(worker.is_sold_out(class_id, worker.get_capacity_version(class_id)))
+        self.fitness_class.available_slots = 5
+        self.fitness_class.save()
+        for worker in workers:
+            self.assertFalse(worker.is_sold_out(class_id, worker.get_capacity_version(class_id)))
+
+    def test_rebalance_reopens_sold_out_class(self):
+        """
+        Test that rebalancing a sold out class with new capacity, as the rebalance_stripes command does in its
+        own process, reopens it in the admission queue of a worker that saw it sold out
+        """
+        FitnessClass.objects.filter(id=self.fitness_class.id).update(available_slots=1)
+        self.book('first@example.com')
+        self.assertEqual(self.book('second@example.com').status_code, 400)
+        worker = AdmissionQueue()
+        worker.mark_sold_out(self.fitness_class.id, worker.get_capacity_version(self.fitness_class.id))
+        sold_out = dict(admission_queue._sold_out)
+
+        rebalance(self.fitness_class, 2, available_slots=3)
+        # the rebalance left every queue's marks alone, only the shared capacity version moved
+        self.assertEqual(admission_queue._sold_out, sold_out)
+        self.assertFalse(worker.is_sold_out(self.fitness_class.id, worker.get_capacity_version(self.fitness_class.id)))
+        self.assertEqual(self.book('second@example.com').status_code, 201)
+
+    @override_settings(BOOKING_ADMISSION_MAX_QUEUE=0)
+    def test_queue_full(self):
+        """
+        Test that a full queue rejects bookings with 503 and Retry-After
+        """
+        response = self.book('john@example.com')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class SampleDataCommandTestCase(APITestCase):
+    def generate(self, **options):
+        call_command('add_sample_data', stdout=StringIO(), **options)
+        return list(FitnessClass.objects.order_by('id').values_list('name', 'instructor', 'start_time',
+                                                                    'available_slots'))
+
+    def test_sample_data_is_idempotent(self):
+        """
+        Test that the default small sample can be loaded twice
+        """
+        self.generate()
+        self.generate()
+        self.assertEqual(FitnessClass.objects.count(), 3)
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_generated_data(self):
+        """
+        Test that generated classes and bookings match the requested volumes and constraints
+        """
+        self.generate(classes=40, bookings=130, instructors=5, clients=20, seed=1, chunk_size=15)
+        self.assertEqual(FitnessClass.objects.count(), 40)
+        self.assertEqual(Booking.objects.count(), 130)
+        self.assertEqual(FitnessClass.objects.values('instructor').distinct().count(), 5)
+        counts = Booking.objects.values('fitness_class').annotate(n=Count('id')).values_list('n', flat=True)
+        self.assertLessEqual(max(counts) - min(counts), 1)
+
+    def test_generated_data_is_deterministic(self):
+        """
+        Test that the same seed generates the same schedule
+        """
+        options = {'classes': 10, 'bookings': 30, 'seed': 7, 'start_date': datetime(2030, 1, 1)}
+        first = self.generate(**options)
+        FitnessClass.objects.all().delete()
+        self.assertEqual(self.generate(**options), first)
+
+    def test_invalid_options(self):
+        """
+        Test that unusable volumes, negative ones included, fail the command with an error and create nothing
+        """
+        invalid = [['--classes', '5', '--chunk-size', '0'], ['--classes', '5', '--instructors', '0'],
+                   ['--bookings', '10'], ['--classes', '2', '--bookings', '10', '--clients', '3']]
+        for args in invalid:
+            with self.assertRaises(CommandError):
+                call_command('add_sample_data', *args, stdout=StringIO())
+        for option in ('--classes', '--bookings', '--clients'):
+            with self.assertRaisesMessage(CommandError, f'argument {option}: must be zero or a positive integer'):
+                call_command('add_sample_data', '--classes', '5', option, '-5', stdout=StringIO())
+        self.assertFalse(FitnessClass.objects.exists())
+
+
+class InstrumentationTestCase(APITestCase):
+    def setUp(self):
+        """
+        Set up an upcoming class with an empty cache
+        """
+        cache.clear()
+        self.fitness_class = FitnessClass.objects.create(name="Yoga", instructor="Alice",
+                                                         start_time=now() + timedelta(days=1), available_slots=5)
+
+    def test_server_timing_header(self):
+        """
+        Test that responses report total, SQL and section timings
+        """
+        data = {'class_id': self.fitness_class.id, 'client_name': 'John Doe', 'client_email': 'john@example.com'}
+        response = self.client.post(reverse('book'), data)
+        timing = response['Server-Timing']
+        self.assertIn('total;dur=', timing)
+        self.assertRegex(timing, r'db;dur=[0-9.]+;desc="[0-9]+ queries"')
+        for section in ('validate', 'book', 'serialize'):
+            self.assertIn(f'{section};dur=', timing)
+
+    async def test_async_server_timing_header(self):
+        """
+        Test that async views also get a Server-Timing header
+        """
+        response = await self.async_client.get(reverse('async-classes'))
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+
+    @override_settings(REQUEST_SLOW_THRESHOLD_MS=0)
+    def test_slow_request_log(self):
+        """
+        Test that requests above the threshold are logged with their timings
+        """
+        with self.assertLogs('booking_api.requests', level='WARNING') as logs:
+            self.client.get(reverse('bookings'), {'email': 'john@example.com'})
+        stats = logs.records[0].request_stats
+        self.assertEqual(stats['path'], '/bookings/')
+        self.assertNotIn('john', logs.output[0])
+        self.assertEqual(stats['queries'], 1)
+
+    def test_profile_disabled_by_default(self):
+        """
+        Test that ?profile=1 is ignored unless profiling is enabled
+        """
+        response = self.client.get(reverse('classes'), {'profile': '1'})
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    @override_settings(REQUEST_PROFILING_ENABLED=True)
+    def test_profile(self):
+        """
+        Test that ?profile=1 returns the request's profile when enabled
+        """
+        response = self.client.get(reverse('classes'), {'profile': '1'})
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertIn(b'function calls', response.content)
+
+
+# many simulated clients share the test client's IP, far above the book_ip rate
+@override_settings(BOOKING_THROTTLE_RATES={})
+class SQLiteStressTestCase(TransactionTestCase):
+    THREADS = 40
+
+    def setUp(self):
+        """
+        Set up a few classes with room for every booking
+        """
+        start_time = now() + timedelta(days=1)
+        self.classes = [FitnessClass.objects.create(name=f"Class {i}", instructor="Alice",
+                                                    start_time=start_time, available_slots=200)
+                        for i in range(3)]
+
+    def test_sqlite_pragmas(self):
+        """
+        Test that new SQLite connections use WAL, synchronous=NORMAL and a busy timeout
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+
+    def test_concurrent_writes_without_lock_errors(self):
+        """
+        Test that concurrent single and batch bookings and reads all complete without lock errors
+        """
+        barrier = Barrier(self.THREADS)
+
+        def client(thread):
+            http = APIClient()
+            statuses = []
+            barrier.wait()
+            try:
+                for i in range(5):
+                    fitness_class = self.classes[(thread + i) % len(self.classes)]
+                    if thread % 4 == 0:
+                        response = http.post(reverse('book-batch'), [
+                            {'class_id': c.id, 'client_name': 'C', 'client_email': f'b{thread}-{i}@example.com'}
+                            for c in self.classes], format='json')
+                        statuses.extend(result['status'] for result in response.data['results'])
+                    elif thread % 4 == 1:
+                        statuses.append(http.get(reverse('bookings'), {'email': f'c{thread}@example.com'}).status_code)
+                    else:
+                        statuses.append(http.post(reverse('book'), {
+                            'class_id': fitness_class.id, 'client_name': 'C',
+                            'client_email': f'c{thread}-{i}@example.com'}).status_code)
+            finally:
+                connection.close()
+            return statuses
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            statuses = [status for statuses in executor.map(client, range(self.THREADS)) for status in statuses]
+
+        self.assertEqual(set(statuses), {200, 201})
+        for fitness_class in self.classes:
+            fitness_class.refresh_from_db()
+            booked = Booking.objects.filter(fitness_class=fitness_class).count()
+            self.assertEqual(booked + fitness_class.available_slots, 200)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTestCase(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        """
+        Set up a class and copy it to the replica stand-in
+        """
+        cache.clear()
+        self.fitness_class = FitnessClass.objects.create(name="Yoga", instructor="Alice",
+                                                         start_time=now() + timedelta(days=1), available_slots=5)
+        call_command('sync_replica', stdout=StringIO())
+
+    def test_reads_use_replica_and_writes_use_primary(self):
+        """
+        Test that querysets are routed to the replica for reads and to the primary for writes
+        """
+        self.assertEqual(FitnessClass.objects.all().db, 'replica')
+        self.assertEqual(FitnessClass.objects.select_for_update().db, 'default')
+
+    def test_listing_reads_from_replica(self):
+        """
+        Test that the class listing is served from the replica, lag included
+        """
+        FitnessClass.objects.create(name="Zumba", instructor="Bob", start_time=now() + timedelta(days=2),
+                                    available_slots=5)
+        names = [c['name'] for c in self.client.get(reverse('classes')).data['results']]
+        self.assertEqual(names, ['Yoga'])
+
+    def test_read_your_writes(self):
+        """
+        Test that a client reads its own booking from the primary right after booking
+        """
+        data = {'class_id': self.fitness_class.id, 'client_name': 'John Doe', 'client_email': 'john@example.com'}
+        client = APIClient()
+        response = client.post(reverse('book'), data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Booking.objects.using('default').count(), 1)
+
+        bookings = client.get(reverse('bookings'), {'email': 'john@example.com'})
+        self.assertEqual(len(bookings.data['results']), 1)
+
+        # another client, without the sticky cookie, still reads the lagging replica
+        other = APIClient().get(reverse('bookings'), {'email': 'john@example.com'})
+        self.assertEqual(len(other.data['results']), 0)
+
+    def test_read_your_writes_through_listing_cache(self):
+        """
+        Test that a client that just booked skips the class listing another client cached from the lagging replica
+        """
+        client = APIClient()
+        data = {'class_id': self.fitness_class.id, 'client_name': 'John Doe', 'client_email': 'john@example.com'}
+        self.assertEqual(client.post(reverse('book'), data).status_code, 201)
+
+        # the booking bumped the schedule version, an unpinned request caches the replica's page under it
+        other = APIClient().get(reverse('classes'))
+        self.assertEqual(other.data['results'][0]['available_slots'], 5)
+
+        for path in ('classes', 'async-classes'):
+            response = client.get(reverse(path), HTTP_IF_NONE_MATCH=other['ETag'])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['results'][0]['available_slots'], 4)
+        # the primary's page replaced the stale one for everybody
+        self.assertEqual(APIClient().get(reverse('classes')).data['results'][0]['available_slots'], 4)
+
+    @override_settings(DATABASE_REPLICAS=['replica', 'replica_b', 'replica_c'])
+    def test_one_replica_per_request(self):
+        """
+        Test that every read of a request goes to the replica picked for it
+        """
+        token = pick_replica()
+        try:
+            aliases = {FitnessClass.objects.all().db for _ in range(20)}
+        finally:
+            release_replica(token)
+        self.assertEqual(len(aliases), 1)
+
+    def test_archive_reads_primary(self):
+        """
+        Test that archive_past copies bookings the lagging replica has not seen before deleting them
+        """
+        past = FitnessClass.objects.create(name="Spin", instructor="Carol", start_time=now() - timedelta(days=60),
+                                           available_slots=4)
+        Booking.objects.create(fitness_class=past, client_name='John Doe', client_email='john@example.com')
+        self.assertEqual(archive_past(now() - timedelta(days=30)), (1, 1))
+        self.assertEqual(ArchivedBooking.objects.using('default').filter(fitness_class_id=past.id).count(), 1)
+
+    def test_schedule_import_reads_primary(self):
+        """
+        Test that importing a schedule again skips the occurrences the lagging replica has not seen
+        """
+        serializer = RecurringScheduleSerializer(data=[{
+            'name': 'Spin', 'instructor': 'Bob', 'days': ['sat'], 'time': '18:30', 'start_date': '2030-03-04',
+            'weeks': 4, 'available_slots': 8}], many=True)
+        serializer.is_valid(raise_exception=True)
+        self.assertEqual(import_schedules(serializer.validated_data), (4, 0))
+        self.assertEqual(import_schedules(serializer.validated_data), (0, 4))
+        self.assertEqual(FitnessClass.objects.using('default').filter(name='Spin').count(), 4)
+
+
+class StripedSlotsTestCase(APITestCase):
+    def setUp(self):
+        """
+        Set up a class striped over 4 counters
+        """
+        cache.clear()
+        self.fitness_class = FitnessClass.objects.create(name="Spin", instructor="Dana",
+                                                         start_time=now() + timedelta(days=1), available_slots=10)
+        call_command('rebalance_stripes', self.fitness_class.id, stripes=4, stdout=StringIO())
+        self.fitness_class.refresh_from_db()
+
+    def book(self, client_email):
+        data = {'class_id': self.fitness_class.id, 'client_name': 'Client', 'client_email': client_email}
+        return self.client.post(reverse('book'), data)
+
+    def test_rebalance_splits_availability(self):
+        """
+        Test that rebalancing spreads the availability evenly over the stripes
+        """
+        stripes = list(self.fitness_class.slot_stripes.order_by('stripe').values_list('available_slots', flat=True))
+        self.assertEqual(stripes, [3, 3, 2, 2])
+        self.assertEqual(self.fitness_class.stripes, 4)
+
+    def test_striped_booking_until_sold_out(self):
+        """
+        Test that bookings drain every stripe and then fail as sold out
+        """
+        for i in range(10):
+            response = self.book(f'client{i}@example.com')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.data['booking']['fitness_class']['available_slots'], 9 - i)
+        response = self.book('late@example.com')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('No available slots for this class', response.data['error'])
+        self.assertEqual(sum(self.fitness_class.slot_stripes.values_list('available_slots', flat=True)), 0)
+
+    def test_listings_show_summed_availability(self):
+        """
+        Test that list endpoints report the summed stripe availability
+        """
+        self.book('john@example.com')
+        classes = self.client.get(reverse('classes')).data['results']
+        self.assertEqual(classes[0]['available_slots'], 9)
+        bookings = self.client.get(reverse('bookings'), {'email': 'john@example.com'}).data['results']
+        self.assertEqual(bookings[0]['fitness_class']['available_slots'], 9)
+
+    def test_batch_booking_striped_class(self):
+        """
+        Test that batch bookings take their slots from the stripes
+        """
+        items = [{'class_id': self.fitness_class.id, 'client_name': 'C', 'client_email': f'c{i}@example.com'}
+                 for i in range(12)]
+        response = self.client.post(reverse('book-batch'), items, format='json')
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses, [201] * 10 + [400] * 2)
+        self.assertEqual(sum(self.fitness_class.slot_stripes.values_list('available_slots', flat=True)), 0)
+
+    def test_capacity_edit_and_unstripe(self):
+        """
+        Test that capacity edits and turning striping off keep the availability
+        """
+        self.book('john@example.com')
+        call_command('rebalance_stripes', self.fitness_class.id, available=20, stdout=StringIO())
+        self.assertEqual(sum(self.fitness_class.slot_stripes.values_list('available_slots', flat=True)), 20)
+        call_command('rebalance_stripes', self.fitness_class.id, stripes=0, stdout=StringIO())
+        self.fitness_class.refresh_from_db()
+        self.assertEqual((self.fitness_class.stripes, self.fitness_class.available_slots), (0, 20))
+        self.assertFalse(self.fitness_class.slot_stripes.exists())
+
+
+class BookingExportTestCase(APITestCase):
+    def setUp(self):
+        """
+        Set up two classes with a few bookings each
+        """
+        self.yoga = FitnessClass.objects.create(name='Yoga', instructor='Alice', available_slots=10,
+                                                start_time=make_aware(datetime(2030, 1, 10, 8, 0)))
+        self.zumba = FitnessClass.objects.create(name='Zumba', instructor='Bob', available_slots=10,
+                                                 start_time=make_aware(datetime(2030, 2, 10, 8, 0)))
+        for fitness_class in (self.yoga, self.zumba):
+            for email in ('john@example.com', 'jane@example.com'):
+                Booking.objects.create(fitness_class=fitness_class, client_name='Client', client_email=email)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+
+    def export(self, url=None, **params):
+        response = self.client.get(url or reverse('bookings-export'), params)
+        return response, b''.join(response.streaming_content).decode() if response.streaming else None
+
+    def test_export_requires_staff(self):
+        """
+        Test that anonymous and non-staff users get 403 from both export endpoints
+        """
+        self.client.logout()
+        urls = [reverse('bookings-export'), reverse('class-roster', args=[self.yoga.id])]
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_user('client'))
+        for url in urls:
+            self.assertEqual(self.client.get(url, {'email': 'john@example.com'}).status_code, 403)
+
+    def test_ndjson_export(self):
+        """
+        Test that the export streams one JSON object per booking joined to its class
+        """
+        response, content = self.export()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0]['class_name'], 'Yoga')
+        self.assertEqual(rows[0]['instructor'], 'Alice')
+        self.assertEqual(rows[0]['start_time'], '2030-01-10 08:00:00')
+        self.assertEqual(rows[0]['client_email'], 'john@example.com')
+
+    def test_csv_roster(self):
+        """
+        Test that a class roster is exported as CSV with a header row
+        """
+        response, content = self.export(reverse('class-roster', args=[self.zumba.id]), format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn(f'roster-{self.zumba.id}.csv', response['Content-Disposition'])
+        rows = list(csv.reader(StringIO(content)))
+        self.assertEqual(rows[0][:3], ['booking_id', 'class_id', 'class_name'])
+        self.assertEqual([row[2] for row in rows[1:]], ['Zumba', 'Zumba'])
+
+        response, _ = self.export(reverse('class-roster', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_export_filters(self):
+        """
+        Test filtering the export by email and class start date range
+        """
+        _, content = self.export(email='jane@example.com', start='2030-02-01', end='2030-03-01')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([(row['class_name'], row['client_email']) for row in rows], [('Zumba', 'jane@example.com')])
+
+        for params in ({'format': 'xml'}, {'start': 'yesterday'}, {'class_id': 'abc'}, {'tz': 'Mars/Base'}):
+            response, _ = self.export(**params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_export_end_date_includes_whole_day(self):
+        """
+        Test that an end date includes classes on that day, while an end datetime stays exclusive
+        """
+        _, content = self.export(start='2030-02-10', end='2030-02-10')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual({row['class_name'] for row in rows}, {'Zumba'})
+        self.assertEqual(len(rows), 2)
+
+        _, content = self.export(start='2030-02-10', end='2030-02-10T08:00')
+        self.assertEqual(content, '')
+
+    def test_export_iterates_in_chunks(self):
+        """
+        Test that the export fetches rows in chunks instead of loading every booking at once
+        """
+        with override_settings(EXPORT_CHUNK_SIZE=1), CaptureQueriesContext(connection) as queries:
+            _, content = self.export()
+        self.assertEqual(len(content.splitlines()), 4)
+        # a single query whose cursor is read chunk by chunk
+        self.assertEqual(len([q for q in queries if 'booking_api_booking' in q['sql']]), 1)
+
+    def test_export_command_matches_endpoint(self):
+        """
+        Test that the export_bookings command writes the same lines as the endpoint
+        """
+        _, content = self.export(format='csv', class_id=self.yoga.id)
+        out = StringIO()
+        call_command('export_bookings', class_id=str(self.yoga.id), format='csv', stdout=out)
+        self.assertEqual(out.getvalue(), content)
+
+
+class ScheduleImportTestCase(APITestCase):
+    def setUp(self):
+        """
+        Write a term timetable to a temporary file
+        """
+        self.schedules = [
+            {'name': 'Yoga', 'instructor': 'Alice', 'days': ['mon', 'wed'], 'time': '08:00',
+             'start_date': '2030-03-04', 'weeks': 12, 'available_slots': 10, 'timezone': 'Europe/London'},
+            {'name': 'Spin', 'instructor': 'Bob', 'days': ['sat'], 'time': '18:30',
+             'start_date': '2030-03-04', 'until': '2030-03-31', 'available_slots': 8},
+        ]
+        self.path = self.write(self.schedules)
+
+    def write(self, schedules):
+        schedule_file = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+        with schedule_file:
+            json.dump(schedules, schedule_file)
+        self.addCleanup(os.remove, schedule_file.name)
+        return schedule_file.name
+
+    def test_import_expands_recurrences(self):
+        """
+        Test that every weekly occurrence is created with the schedule's slots
+        """
+        call_command('import_schedule', self.path, stdout=StringIO())
+        self.assertEqual(FitnessClass.objects.filter(name='Yoga', instructor='Alice').count(), 24)
+        spin = FitnessClass.objects.filter(name='Spin').order_by('start_time')
+        self.assertEqual([get_time_in_timezone(c.start_time, 'Asia/Kolkata') for c in spin],
+                         [f'2030-03-{day:02} 18:30:00' for day in (9, 16, 23, 30)])
+        self.assertEqual({c.available_slots for c in spin}, {8})
+
+    def test_import_keeps_wall_clock_time_across_dst(self):
+        """
+        Test that occurrences stay at 08:00 local time when the clocks change
+        """
+        call_command('import_schedule', self.path, stdout=StringIO())
+        classes = FitnessClass.objects.filter(name='Yoga').order_by('start_time')
+        self.assertEqual({get_time_in_timezone(c.start_time, 'Europe/London')[11:] for c in classes}, {'08:00:00'})
+        # Europe/London moves to BST on 2030-03-31
+        self.assertEqual(get_time_in_timezone(classes[0].start_time, 'UTC'), '2030-03-04 08:00:00')
+        self.assertEqual(get_time_in_timezone(classes[23].start_time, 'UTC'), '2030-05-22 07:00:00')
+
+    def test_reimport_skips_existing_occurrences(self):
+        """
+        Test that importing again, or an extended term, only adds the missing occurrences
+        """
+        call_command('import_schedule', self.path, stdout=StringIO())
+        out = StringIO()
+        call_command('import_schedule', self.path, stdout=out)
+        self.assertIn('Created 0 classes, skipped 28 existing', out.getvalue())
+
+        self.schedules[0]['weeks'] = 13
+        out = StringIO()
+        call_command('import_schedule', self.write(self.schedules), stdout=out)
+        self.assertIn('Created 2 classes, skipped 28 existing', out.getvalue())
+        self.assertEqual(FitnessClass.objects.count(), 30)
+
+    def test_invalid_schedule(self):
+        """
+        Test that invalid schedules are rejected before anything is created
+        """
+        self.schedules[1]['days'] = ['someday']
+        self.schedules[1]['weeks'] = 2
+        with self.assertRaisesMessage(CommandError, 'schedule 1'):
+            call_command('import_schedule', self.write(self.schedules), stdout=StringIO())
+        self.assertFalse(FitnessClass.objects.exists())
+
+    def test_existing_occurrences_use_natural_key_index(self):
+        """
+        Test that the lookup of existing occurrences is an index range scan
+        """
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_schedule', self.path, stdout=StringIO())
+        lookups = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertEqual(len(lookups), 2)
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {lookups[0]}')
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('fitnessclass_natural_key', plan)
+
+
+class ClassFilterTestCase(APITestCase):
+    def setUp(self):
+        """
+        Set up classes for two instructors, one of them sold out
+        """
+        cache.clear()
+        self.yoga = FitnessClass.objects.create(name='Yoga', instructor='Alice', available_slots=5,
+                                                start_time=make_aware(datetime(2030, 1, 10, 8, 0)))
+        self.zumba = FitnessClass.objects.create(name='Zumba', instructor='Bob', available_slots=0,
+                                                 start_time=make_aware(datetime(2030, 1, 11, 8, 0)))
+        self.hiit = FitnessClass.objects.create(name='HIIT', instructor='Alice', available_slots=3,
+                                                start_time=make_aware(datetime(2030, 1, 12, 8, 0)))
+
+    def list_names(self, **params):
+        response = self.client.get(reverse('classes'), params)
+        self.assertEqual(response.status_code, 200)
+        return [c['name'] for c in response.data['results']]
+
+    def test_filters(self):
+        """
+        Test filtering by instructor, name, date window and free slots
+        """
+        self.assertEqual(self.list_names(instructor='Alice'), ['Yoga', 'HIIT'])
+        self.assertEqual(self.list_names(name='Zumba'), ['Zumba'])
+        self.assertEqual(self.list_names(**{'from': '2030-01-11', 'to': '2030-01-11'}), ['Zumba'])
+        self.assertEqual(self.list_names(**{'from': '2030-01-11T12:00:00'}), ['HIIT'])
+        self.assertEqual(self.list_names(available='true'), ['Yoga', 'HIIT'])
+        self.assertEqual(self.list_names(instructor='Alice', available='true', to='2030-01-10'), ['Yoga'])
+
+    def test_available_filter_with_striped_classes(self):
+        """
+        Test that available=true uses the stripe totals of striped classes
+        """
+        rebalance(self.yoga, 2, available_slots=0)
+        rebalance(self.zumba, 2, available_slots=4)
+        self.assertEqual(self.list_names(available='true'), ['Zumba', 'HIIT'])
+
+    def test_invalid_filter(self):
+        """
+        Test that an invalid date gets 400 from the sync and async listings
+        """
+        for url in (reverse('classes'), reverse('async-classes')):
+            response = self.client.get(url, {'from': 'next week'})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'Invalid from, use YYYY-MM-DD or an ISO datetime'})
+
+    def test_async_filters_match_sync(self):
+        """
+        Test that the async listing applies the same filters
+        """
+        params = {'instructor': 'Alice', 'available': 'true'}
+        self.assertEqual(self.client.get(reverse('async-classes'), params).json(),
+                         self.client.get(reverse('classes'), params).json())
+
+    def test_filters_use_indexes(self):
+        """
+        Test that every filter is an index range scan, never a scan of the class table
+        """
+        cases = [
+            ({'instructor': 'Alice'}, 'fitnessclass_instructor_start'),
+            ({'name': 'Yoga'}, 'fitnessclass_name_start'),
+            ({'from': '2030-01-11', 'to': '2030-01-12'}, 'fitnessclass_start_time_id'),
+            ({'available': 'true'}, 'fitnessclass_bookable'),
+        ]
+        for params, index in cases:
+            with self.subTest(params=params), CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('classes'), params)
+                sql = queries.captured_queries[-1]['sql']
+                with connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                    plan = ' '.join(str(row) for row in cursor.fetchall())
+                self.assertIn(index, plan)
+                self.assertNotIn('SCAN booking_api_fitnessclass', plan)
+
+
+class SparseFieldsetTestCase(APITestCase):
+    def setUp(self):
+        """
+        Set up two classes booked by one client
+        """
+        cache.clear()
+        self.classes = [
+            FitnessClass.objects.create(name=name, instructor='Alice', available_slots=5,
+                                        start_time=make_aware(datetime(2030, 1, day, 8, 0)))
+            for day, name in ((10, 'Yoga'), (11, 'Zumba'))
+        ]
+        for fitness_class in self.classes:
+            Booking.objects.create(fitness_class=fitness_class, client_name='John', client_email='john@example.com')
+
+    def test_sparse_class_fields(self):
+        """
+        Test that ?fields= limits the class listing to the requested fields, still keyset paginated
+        """
+        response = self.client.get(reverse('classes'), {'fields': 'available_slots,id', 'page_size': 1})
+        self.assertEqual(response.data['results'], [{'id': self.classes[0].id, 'available_slots': 5}])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'], [{'id': self.classes[1].id, 'available_slots': 5}])
+
+        response = self.client.get(reverse('classes'), {'fields': 'id,price'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'Unknown fields: price'})
+
+    def test_sparse_booking_fields_skip_class_join(self):
+        """
+        Test that bookings without fitness_class in ?fields= are read without joining the class table
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('bookings'), {'email': 'john@example.com', 'fields': 'id,created_at'})
+        self.assertEqual([set(booking) for booking in response.data['results']], [{'id', 'created_at'}] * 2)
+        self.assertNotIn('JOIN', queries.captured_queries[-1]['sql'])
+
+    def test_normalized_bookings(self):
+        """
+        Test that normalize=true references classes by id and lists each of them once
+        """
+        params = {'email': 'john@example.com'}
+        nested = self.client.get(reverse('bookings'), params).data
+        normalized = self.client.get(reverse('bookings'), {**params, 'normalize': 'true'}).data
+        self.assertEqual([booking['fitness_class'] for booking in normalized['results']],
+                         [fitness_class.id for fitness_class in self.classes])
+        self.assertEqual(normalized['classes'], [booking['fitness_class'] for booking in nested['results']])
+
+    def test_async_sparse_and_normalized_match_sync(self):
+        """
+        Test that the async list views apply ?fields= and normalize=true the same way
+        """
+        cases = [
+            ('classes', 'async-classes', {'fields': 'id,name'}),
+            ('bookings', 'async-bookings', {'email': 'john@example.com', 'fields': 'id,fitness_class',
+                                            'normalize': 'true'}),
+        ]
+        for sync_name, async_name, params in cases:
+            self.assertEqual(self.client.get(reverse(async_name), params).json(),
+                             self.client.get(reverse(sync_name), params).json())
+
+    def test_fast_renderer_matches_json_renderer(self):
+        """
+        Test that FastJSONRenderer renders the same bytes as DRF's JSONRenderer, datetimes and int keys included
+        """
+        data = {'results': [{'id': 1, 'name': 'Yoga\u2028café', 'slots': None, 'ok': True}],
+                'error': [ErrorDetail('No available slots for this class')], 'when': make_aware(datetime(2030, 1, 1)),
+                'created_at': Booking.objects.first().created_at, 'by_class': {1: 2, 3: [4]}, 'big': 2 ** 70}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_fast_renderer_is_opt_in(self):
+        """
+        Test that responses use JSONRenderer unless the client asks for ?format=fastjson
+        """
+        response = self.client.get(reverse('bookings'), {'email': 'john@example.com'})
+        self.assertIs(type(response.accepted_renderer), JSONRenderer)
+        fast = self.client.get(reverse('bookings'), {'email': 'john@example.com', 'format': 'fastjson'})
+        self.assertIsInstance(fast.accepted_renderer, FastJSONRenderer)
+        self.assertEqual(fast['Content-Type'], 'application/json')
+        self.assertEqual(fast.content, response.content)
+
+
+class IdempotencyTestCase(APITestCase):
+    def setUp(self):
+        """
+        Set up a class with one slot and an empty idempotency store
+        """
+        cache.clear()
+        self.fitness_class = FitnessClass.objects.create(name='Spin', instructor='Dana', available_slots=1,
+                                                         start_time=now() + timedelta(days=1))
+        self.data = {'class_id': self.fitness_class.id, 'client_name': 'John', 'client_email': 'john@example.com'}
+
+    def book(self, key, data=None):
+        return self.client.post(reverse('book'), data or self.data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_is_replayed_without_queries(self):
+        """
+        Test that a retry with the same key gets the first response without touching the database
+        """
+        first = self.book('retry-1')
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(0):
+            retry = self.book('retry-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Booking.objects.count(), 1)
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 0)
+
+    def test_key_reused_for_another_request(self):
+        """
+        Test that a key sent again with a different body gets 422
+        """
+        self.book('retry-2')
+        response = self.book('retry-2', {**self.data, 'client_email': 'jane@example.com'})
+        self.assertEqual(response.status_code, 422)
+
+    def test_requests_without_key_are_not_stored(self):
+        """
+        Test that bookings without an Idempotency-Key behave as before
+        """
+        self.client.post(reverse('book'), self.data, format='json')
+        response = self.client.post(reverse('book'), self.data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0.05)
+    def test_in_flight_key_times_out(self):
+        """
+        Test that a repeat waiting too long for the in-flight request gets 409 with Retry-After
+        """
+        request = Request(APIRequestFactory().post(reverse('book'), self.data, format='json'), parsers=[JSONParser()])
+        cache.add('booking_api:idempotency:retry-3:lock', get_fingerprint(request))
+        response = self.book('retry-3')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(Booking.objects.exists())
+
+    @override_settings(BOOKING_THROTTLE_RATES={'book_ip': '60/min', 'book_email': '10/min', 'book_class': '1200/min'})
+    def test_key_with_throttles_enabled(self):
+        """
+        Test that keyed bookings work once the throttles have parsed the body
+        """
+        first = self.book('retry-throttled')
+        self.assertEqual(first.status_code, 201)
+        retry = self.book('retry-throttled')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        batch = self.client.post(reverse('book-batch'), [self.data], format='json',
+                                 HTTP_IDEMPOTENCY_KEY='batch-throttled')
+        self.assertEqual(batch.status_code, 200)
+
+    def test_batch_retry_is_replayed(self):
+        """
+        Test that batch bookings are replayed the same way
+        """
+        items = [self.data]
+        first = self.client.post(reverse('book-batch'), items, format='json', HTTP_IDEMPOTENCY_KEY='batch-1')
+        with self.assertNumQueries(0):
+            retry = self.client.post(reverse('book-batch'), items, format='json', HTTP_IDEMPOTENCY_KEY='batch-1')
+        self.assertEqual(retry.json(), first.json())
+
+
+class ConcurrentIdempotencyTestCase(TransactionTestCase):
+    THREADS = 10
+
+    def test_concurrent_repeats_wait_for_first_response(self):
+        """
+        Test that simultaneous requests with one key book once and all get the same response
+        """
+        cache.clear()
+        fitness_class = FitnessClass.objects.create(name='Spin', instructor='Dana', available_slots=5,
+                                                    start_time=now() + timedelta(days=1))
+        data = {'class_id': fitness_class.id, 'client_name': 'John', 'client_email': 'john@example.com'}
+        barrier = Barrier(self.THREADS)
+
+        def book(_):
+            barrier.wait()
+            try:
+                response = APIClient().post(reverse('book'), data, format='json', HTTP_IDEMPOTENCY_KEY='same-key')
+                return response.status_code, response.json()
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            responses = list(executor.map(book, range(self.THREADS)))
+
+        self.assertEqual({status for status, _ in responses}, {201})
+        self.assertEqual(len({json.dumps(body) for _, body in responses}), 1)
+        self.assertEqual(Booking.objects.count(), 1)
+        fitness_class.refresh_from_db()
+        self.assertEqual(fitness_class.available_slots, 4)
+
+
+class ThrottleTestCase(APITestCase):
+    def setUp(self):
+        """
+        Set up two classes, empty token buckets and a controllable throttle clock
+        """
+        cache.clear()
+        self.classes = [
+            FitnessClass.objects.create(name=name, instructor='Alice', available_slots=10,
+                                        start_time=now() + timedelta(days=1))
+            for name in ('Yoga', 'Zumba', 'HIIT')
+        ]
+        clock = patch.object(TokenBucketThrottle, 'timer', Mock(return_value=1000.0))
+        self.timer = clock.start()
+        self.addCleanup(clock.stop)
+
+    def book(self, fitness_class, client_email):
+        data = {'class_id': fitness_class.id, 'client_name': 'Client', 'client_email': client_email}
+        return self.client.post(reverse('book'), data, format='json')
+
+    @override_settings(BOOKING_THROTTLE_RATES={'book_email': '2/min'})
+    def test_email_throttle_rejects_before_orm(self):
+        """
+        Test that a client over its booking rate gets 429 with Retry-After without any query
+        """
+        self.assertEqual(self.book(self.classes[0], 'john@example.com').status_code, 201)
+        self.assertEqual(self.book(self.classes[1], 'John@Example.com').status_code, 201)
+        with self.assertNumQueries(0):
+            response = self.book(self.classes[2], 'john@example.com')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(self.book(self.classes[2], 'jane@example.com').status_code, 201)
+
+    @override_settings(BOOKING_THROTTLE_RATES={'book_ip': '2/min'})
+    def test_bucket_refills_over_time(self):
+        """
+        Test that tokens come back at the configured rate, up to the bucket size
+        """
+        statuses = [self.book(self.classes[i], f'c{i}@example.com').status_code for i in range(3)]
+        self.assertEqual(statuses, [201, 201, 429])
+        self.timer.return_value += 30
+        self.assertEqual(self.book(self.classes[2], 'c2@example.com').status_code, 201)
+        self.assertEqual(self.book(self.classes[2], 'c3@example.com').status_code, 429)
+
+    @override_settings(BOOKING_THROTTLE_RATES={'book_ip': '3/min'})
+    def test_batch_costs_one_token_per_item(self):
+        """
+        Test that a batch takes one IP token per booking
+        """
+        items = [{'class_id': self.classes[0].id, 'client_name': 'C', 'client_email': f'c{i}@example.com'}
+                 for i in range(2)]
+        self.assertEqual(self.client.post(reverse('book-batch'), items, format='json').status_code, 200)
+        self.assertEqual(self.client.post(reverse('book-batch'), items, format='json').status_code, 429)
+
+    @override_settings(BOOKING_THROTTLE_RATES={'book_email': '2/min', 'book_class': '3/min'})
+    def test_batch_shares_email_and_class_buckets(self):
+        """
+        Test that /book/batch/ takes one token per item from the email and class buckets /book/ uses
+        """
+        self.assertEqual(self.book(self.classes[0], 'john@example.com').status_code, 201)
+        self.assertEqual(self.book(self.classes[1], 'john@example.com').status_code, 201)
+        items = [{'class_id': self.classes[2].id, 'client_name': 'C', 'client_email': email}
+                 for email in ('jane@example.com', 'John@example.com')]
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('book-batch'), items, format='json')
+        self.assertEqual(response.status_code, 429)
+        # the email buckets are charged together, jane's is untouched by the rejected batch
+        self.assertEqual(self.book(self.classes[2], 'jane@example.com').status_code, 201)
+        # while the batch's two items did take the class's tokens, like a rejected /book/ request does
+        self.assertEqual(self.book(self.classes[2], 'dana@example.com').status_code, 429)
+
+    @override_settings(BOOKING_THROTTLE_RATES={'book_class': '1/min'})
+    def test_class_throttle(self):
+        """
+        Test that bookings are also limited per class, whoever sends them
+        """
+        self.assertEqual(self.book(self.classes[0], 'john@example.com').status_code, 201)
+        self.assertEqual(self.book(self.classes[0], 'jane@example.com').status_code, 429)
+        self.assertEqual(self.book(self.classes[1], 'jane@example.com').status_code, 201)
+
+    @override_settings(BOOKING_THROTTLE_RATES={'lookup_ip': '1/min', 'availability_ip': '2/min'})
+    def test_availability_has_its_own_bucket(self):
+        """
+        Test that polling /classes/availability/ leaves the client's booking lookups alone
+        """
+        statuses = [self.client.get(reverse('classes-availability'), {'ids': self.classes[0].id}).status_code
+                    for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(self.client.get(reverse('bookings'), {'email': 'john@example.com'}).status_code, 200)
+
+    @override_settings(BOOKING_THROTTLE_RATES={'lookup_email': '1/min', 'book_email': None})
+    def test_lookup_throttle_sync_and_async(self):
+        """
+        Test that lookups share one read bucket per email across the sync and async views
+        """
+        self.assertEqual(self.client.get(reverse('bookings'), {'email': 'john@example.com'}).status_code, 200)
+        response = self.client.get(reverse('async-bookings'), {'email': 'john@example.com'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(self.client.get(reverse('bookings'), {'email': 'jane@example.com'}).status_code, 200)
+        # reads and writes have separate rates
+        self.assertEqual(self.book(self.classes[0], 'john@example.com').status_code, 201)
+
+
+@override_settings(AVAILABILITY_STREAM_INTERVAL=0.05)
+class AvailabilityStreamTestCase(APITestCase):
+    def setUp(self):
+        """
+        Set up two classes
+        """
+        cache.clear()
+        self.yoga = FitnessClass.objects.create(name='Yoga', instructor='Alice', available_slots=5,
+                                                start_time=now() + timedelta(days=1))
+        self.zumba = FitnessClass.objects.create(name='Zumba', instructor='Bob', available_slots=8,
+                                                 start_time=now() + timedelta(days=1))
+
+    async def open_stream(self, *class_ids):
+        response = await self.async_client.get(reverse('classes-stream'), {'ids': ','.join(map(str, class_ids))})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return aclosing(response.streaming_content)
+
+    async def next_event(self, stream, timeout=2):
+        while True:
+            chunk = (await asyncio.wait_for(anext(stream), timeout)).decode()
+            if chunk.startswith('event: availability'):
+                return json.loads(chunk.split('data: ', 1)[1])
+
+    def book(self, *client_emails):
+        # one transaction, its on_commit publishes all run together
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            for client_email in client_emails:
+                self.client.post(reverse('book'), {'class_id': self.yoga.id, 'client_name': 'Client',
+                                                   'client_email': client_email})
+
+    async def test_snapshot_then_changes(self):
+        """
+        Test that the stream sends every class once, then the slots of a class after a booking
+        """
+        async with await self.open_stream(self.yoga.id, self.zumba.id) as stream:
+            self.assertEqual(await self.next_event(stream), {'id': self.yoga.id, 'available_slots': 5})
+            self.assertEqual(await self.next_event(stream), {'id': self.zumba.id, 'available_slots': 8})
+            await sync_to_async(self.book)('john@example.com')
+            self.assertEqual(await self.next_event(stream), {'id': self.yoga.id, 'available_slots': 4})
+
+    @override_settings(AVAILABILITY_STREAM_INTERVAL=0.2)
+    async def test_bursts_are_coalesced(self):
+        """
+        Test that many bookings between two checks produce one event with the latest slots
+        """
+        async with await self.open_stream(self.yoga.id) as stream:
+            await self.next_event(stream)
+            await sync_to_async(self.book)(*[f'client{i}@example.com' for i in range(5)])
+            self.assertEqual(await self.next_event(stream), {'id': self.yoga.id, 'available_slots': 0})
+            with self.assertRaises(asyncio.TimeoutError):
+                await self.next_event(stream, timeout=0.5)
+
+    @override_settings(AVAILABILITY_BROKER='booking_api.events.CacheBroker')
+    async def test_cache_broker_and_deleted_class(self):
+        """
+        Test that the cache broker carries changes, here a deleted class sent with null slots
+        """
+        def delete():
+            with self.captureOnCommitCallbacks(execute=True):
+                FitnessClass.objects.get(id=self.zumba.id).delete()
+
+        async with await self.open_stream(self.zumba.id) as stream:
+            await self.next_event(stream)
+            await sync_to_async(delete)()
+            self.assertEqual(await self.next_event(stream), {'id': self.zumba.id, 'available_slots': None})
+
+    @override_settings(AVAILABILITY_STREAM_HEARTBEAT=0.1)
+    async def test_heartbeat(self):
+        """
+        Test that an idle stream sends keep-alive comments
+        """
+        async with await self.open_stream(self.yoga.id) as stream:
+            await self.next_event(stream)
+            self.assertEqual(await asyncio.wait_for(anext(stream), 2), b': keep-alive\n\n')
+
+    def test_invalid_requests(self):
+        """
+        Test that bad ids get 400 and a sync (WSGI) server gets 501
+        """
+        for ids in ('', 'abc', ','.join(map(str, range(101)))):
+            response = async_to_sync(self.async_client.get)(reverse('classes-stream'), {'ids': ids})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('classes-stream'), {'ids': self.yoga.id}).status_code, 501)
+
+
+class ArchiveTestCase(APITestCase):
+    def setUp(self):
+        """
+        Set up two long past classes (one striped), a recent one and an upcoming one, all booked by John
+        """
+        self.old_yoga = FitnessClass.objects.create(name='Yoga', instructor='Alice', available_slots=4,
+                                                    start_time=now() - timedelta(days=60))
+        self.old_zumba = FitnessClass.objects.create(name='Zumba', instructor='Bob', available_slots=7,
+                                                     start_time=now() - timedelta(days=40))
+        self.recent = FitnessClass.objects.create(name='HIIT', instructor='Carol', available_slots=4,
+                                                  start_time=now() - timedelta(days=5))
+        self.upcoming = FitnessClass.objects.create(name='Pilates', instructor='Dave', available_slots=4,
+                                                    start_time=now() + timedelta(days=1))
+        self.old_zumba = rebalance(self.old_zumba, 3)
+        # created in class order, a day apart
+        self.bookings = [
+            Booking.objects.create(fitness_class=fitness_class, client_name='Client', client_email=client_email)
+            for fitness_class, client_email in [(self.old_yoga, 'john@example.com'),
+                                                (self.old_zumba, 'john@example.com'),
+                                                (self.recent, 'john@example.com'),
+                                                (self.upcoming, 'john@example.com'),
+                                                (self.old_zumba, 'jane@example.com')]
+        ]
+        for days, booking in enumerate(self.bookings):
+            booking.created_at = now() - timedelta(days=100 - days)
+            Booking.objects.filter(id=booking.id).update(created_at=booking.created_at)
+
+    def test_archive_moves_past_classes_and_bookings(self):
+        """
+        Test that archive_past moves classes older than the cutoff with their bookings, keeping ids and counts
+        """
+        out = StringIO()
+        call_command('archive_past', chunk_size=1, stdout=out)
+        self.assertIn('Archived 2 classes and 3 bookings', out.getvalue())
+
+        self.assertCountEqual(FitnessClass.objects.values_list('id', flat=True), [self.recent.id, self.upcoming.id])
+        self.assertEqual(Booking.objects.count(), 2)
+        self.assertFalse(SlotStripe.objects.exists())
+        self.assertEqual(dict(ArchivedFitnessClass.objects.values_list('id', 'available_slots')),
+                         {self.old_yoga.id: 4, self.old_zumba.id: 7})
+        archived = ArchivedBooking.objects.get(id=self.bookings[0].id)
+        self.assertEqual((archived.fitness_class_id, archived.client_email, archived.created_at),
+                         (self.old_yoga.id, 'john@example.com', self.bookings[0].created_at))
+
+        self.assertEqual(archive_past(now()), (1, 1))
+        self.assertEqual(archive_past(now()), (0, 0))
+
+    def test_interrupted_archive_keeps_whole_chunks(self):
+        """
+        Test that a chunk failing midway leaves its classes and bookings in the hot tables
+        """
+        bulk_create = QuerySet.bulk_create
+        calls = []
+
+        def fail_second_chunk(queryset, *args, **kwargs):
+            if queryset.model is ArchivedBooking:
+                calls.append(1)
+                if len(calls) == 2:
+                    raise RuntimeError('interrupted')
+            return bulk_create(queryset, *args, **kwargs)
+
+        with patch.object(QuerySet, 'bulk_create', fail_second_chunk), self.assertRaises(RuntimeError):
+            archive_past(now() - timedelta(days=30), chunk_size=1)
+        self.assertEqual(list(ArchivedFitnessClass.objects.values_list('id', flat=True)), [self.old_yoga.id])
+        self.assertTrue(FitnessClass.objects.filter(id=self.old_zumba.id, stripes=3).exists())
+        self.assertEqual(Booking.objects.filter(fitness_class=self.old_zumba).count(), 2)
+
+    def test_cutoff_in_the_future(self):
+        """
+        Test that archive_past refuses a cutoff after now and invalid dates
+        """
+        for before in ((now() + timedelta(days=1)).isoformat(), 'yesterday'):
+            with self.assertRaises(CommandError):
+                call_command('archive_past', before=before, stdout=StringIO())
+        self.assertFalse(ArchivedFitnessClass.objects.exists())
+
+    def test_include_archived(self):
+        """
+        Test that /bookings/ lists archived bookings only with include_archived=true, merged in created_at order
+        """
+        archive_past(now() - timedelta(days=30))
+        params = {'email': 'john@example.com'}
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('bookings'), params)
+        self.assertEqual([booking['id'] for booking in response.json()['results']],
+                         [self.bookings[2].id, self.bookings[3].id])
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('bookings'), {**params, 'include_archived': 'true'})
+        results = response.json()['results']
+        self.assertEqual([booking['id'] for booking in results], [booking.id for booking in self.bookings[:4]])
+        self.assertEqual(results[1]['fitness_class']['id'], self.old_zumba.id)
+        self.assertEqual(results[1]['fitness_class']['available_slots'], 7)
+
+        # the cursor walks across both tables
+        ids = []
+        url, query = reverse('bookings'), {**params, 'include_archived': 'true', 'page_size': 1}
+        while url:
+            page = self.client.get(url, query).json()
+            ids += [booking['id'] for booking in page['results']]
+            url, query = page['next'], None
+        self.assertEqual(ids, [booking.id for booking in self.bookings[:4]])
+
+        response = self.client.get(reverse('bookings'), {**params, 'include_archived': 'true', 'past': 'true'})
+        self.assertEqual([booking['id'] for booking in response.json()['results']],
+                         [booking.id for booking in self.bookings[:3]])
+
+    def test_async_include_archived_matches_sync(self):
+        """
+        Test that the async bookings view merges archived bookings like the sync one
+        """
+        archive_past(now() - timedelta(days=30))
+        params = {'email': 'john@example.com', 'include_archived': 'true', 'normalize': 'true', 'page_size': 3}
+        data = async_to_sync(self.async_client.get)(reverse('async-bookings'), params).json()
+        expected = self.client.get(reverse('bookings'), params).json()
+        self.assertEqual(data['next'].replace('/async/', '/'), expected.pop('next'))
+        self.assertEqual({**data, 'next': None}, {**expected, 'next': None})
+        self.assertEqual(len(data['classes']), 3)
+
+
+class ClassAvailabilityTestCase(APITestCase):
+    def setUp(self):
+        """
+        Set up a plain and a striped class and an empty slot snapshot
+        """
+        cache.clear()
+        # ids are reused across tests, the snapshot must not remember the previous test's classes
+        slot_snapshot.clear()
+        self.yoga = FitnessClass.objects.create(name='Yoga', instructor='Alice', available_slots=5,
+                                                start_time=now() + timedelta(days=1))
+        self.zumba = rebalance(FitnessClass.objects.create(name='Zumba', instructor='Bob', available_slots=8,
+                                                           start_time=now() + timedelta(days=1)), 4)
+        self.ids = f'{self.yoga.id},{self.zumba.id},{self.zumba.id + 100}'
+
+    def lookup(self, ids=None):
+        response = self.client.get(reverse('classes-availability'), {'ids': ids or self.ids})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def book(self, fitness_class, client_email):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('book'), {'class_id': fitness_class.id, 'client_name': 'Client',
+                                                          'client_email': client_email})
+        self.assertEqual(response.status_code, 201)
+
+    def test_lookup_from_snapshot(self):
+        """
+        Test that the lookup maps ids to slots (null when unknown) with one query, then none at all
+        """
+        expected = {str(self.yoga.id): 5, str(self.zumba.id): 8, str(self.zumba.id + 100): None}
+        with self.assertNumQueries(1):
+            self.assertEqual(self.lookup(), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.lookup(), expected)
+
+    def test_bookings_refresh_only_changed_classes(self):
+        """
+        Test that a committed booking makes the next lookup read just its class again
+        """
+        self.lookup()
+        self.book(self.zumba, 'john@example.com')
+        with CaptureQueriesContext(connection) as queries:
+            data = self.lookup()
+        self.assertEqual(data[str(self.zumba.id)], 7)
+        self.assertEqual(data[str(self.yoga.id)], 5)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn(str(self.yoga.id), queries[0]['sql'].split('IN', 1)[1])
+        with self.assertNumQueries(0):
+            self.lookup()
+
+    def test_max_staleness(self):
+        """
+        Test that a change the broker never hears of is served for at most AVAILABILITY_SNAPSHOT_MAX_AGE seconds
+        """
+        with patch('booking_api.availability.time.monotonic', Mock(return_value=1000.0)) as monotonic:
+            self.lookup()
+            FitnessClass.objects.filter(id=self.yoga.id).update(available_slots=0)
+            monotonic.return_value = 1004.0
+            self.assertEqual(self.lookup()[str(self.yoga.id)], 5)
+            monotonic.return_value = 1005.0
+            self.assertEqual(self.lookup()[str(self.yoga.id)], 0)
+
+    @override_settings(AVAILABILITY_BROKER='booking_api.events.CacheBroker')
+    def test_changes_from_other_workers(self):
+        """
+        Test that with the cache broker a change published by another worker refreshes the snapshot
+        """
+        self.lookup()
+        FitnessClass.objects.filter(id=self.yoga.id).update(available_slots=1)
+        # what another worker's booking publishes
+        CacheBroker().publish(self.yoga.id)
+        self.assertEqual(self.lookup()[str(self.yoga.id)], 1)
+
+    @override_settings(AVAILABILITY_SNAPSHOT_MAX_CLASSES=2)
+    def test_snapshot_size_is_bounded(self):
+        """
+        Test that the snapshot never keeps more than AVAILABILITY_SNAPSHOT_MAX_CLASSES classes
+        """
+        self.lookup(f'{self.yoga.id},{self.zumba.id}')
+        self.assertEqual(self.lookup(f'{self.zumba.id + 100}'), {str(self.zumba.id + 100): None})
+        with self.assertNumQueries(1):
+            self.lookup(f'{self.yoga.id}')
+
+    def test_invalid_ids(self):
+        """
+        Test that missing, malformed or too many ids get 400
+        """
+        for ids in ('', 'abc', ','.join(map(str, range(101)))):
+            response = self.client.get(reverse('classes-availability'), {'ids': ids})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('error', response.json())
+
+
+class MetricsTestCase(APITestCase):
+    def setUp(self):
+        """
+        Set up a class with two slots left
+        """
+        cache.clear()
+        self.fitness_class = FitnessClass.objects.create(name='Yoga', instructor='Alice', available_slots=2,
+                                                         start_time=now() + timedelta(days=1))
+
+    def book(self, client_email, **extra):
+        return self.client.post(reverse('book'), {'class_id': self.fitness_class.id, 'client_name': 'Client',
+                                                  'client_email': client_email}, format='json', **extra)
+
+    def get_outcomes(self):
+        return {outcome: bookings_total.get(outcome) for outcome in ('created', 'sold_out', 'duplicate', 'invalid')}
+
+    def test_request_metrics(self):
+        """
+        Test that requests are counted and timed per view, method and status
+        """
+        before = (requests_total.get('FitnessClassListView', 'GET', '200'),
+                  requests_total.get('BookingCreateView', 'POST', '201'),
+                  request_duration.get_count('BookingListView'))
+        self.client.get(reverse('classes'))
+        self.book('john@example.com')
+        self.client.get(reverse('bookings'), {'email': 'john@example.com'})
+        self.client.get('/no-such-page/')
+        self.assertEqual((requests_total.get('FitnessClassListView', 'GET', '200'),
+                          requests_total.get('BookingCreateView', 'POST', '201'),
+                          request_duration.get_count('BookingListView')),
+                         (before[0] + 1, before[1] + 1, before[2] + 1))
+        self.assertGreater(requests_total.get('unresolved', 'GET', '404'), 0)
+
+    def test_booking_outcomes(self):
+        """
+        Test that every booking attempt, batch items included, is counted by outcome, and retries are not
+        """
+        before = self.get_outcomes()
+        self.book('john@example.com', HTTP_IDEMPOTENCY_KEY='attempt-1')
+        self.book('john@example.com', HTTP_IDEMPOTENCY_KEY='attempt-1')
+        self.book('john@example.com')
+        self.client.post(reverse('book'), {'client_email': 'jane@example.com'}, format='json')
+        self.client.post(reverse('book-batch'), [
+            {'class_id': self.fitness_class.id, 'client_name': 'Client', 'client_email': 'jane@example.com'},
+            {'class_id': self.fitness_class.id, 'client_name': 'Client', 'client_email': 'bob@example.com'},
+        ], format='json')
+        self.book('carol@example.com')
+        after = self.get_outcomes()
+        self.assertEqual({outcome: after[outcome] - before[outcome] for outcome in after},
+                         {'created': 2, 'sold_out': 2, 'duplicate': 1, 'invalid': 1})
+
+    def test_lock_wait(self):
+        """
+        Test that the slot lock wait of single and batch bookings is recorded
+        """
+        single, batch = booking_lock_wait.get_count('single'), booking_lock_wait.get_count('batch')
+        self.book('john@example.com')
+        self.client.post(reverse('book-batch'), [
+            {'class_id': self.fitness_class.id, 'client_name': 'Client', 'client_email': 'jane@example.com'},
+        ], format='json')
+        self.assertEqual(booking_lock_wait.get_count('single'), single + 1)
+        self.assertEqual(booking_lock_wait.get_count('batch'), batch + 1)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        """
+        Test that nothing is recorded with METRICS_ENABLED off
+        """
+        before = (requests_total.get('BookingCreateView', 'POST', '201'), self.get_outcomes(),
+                  booking_lock_wait.get_count('single'))
+        self.book('john@example.com')
+        self.assertEqual((requests_total.get('BookingCreateView', 'POST', '201'), self.get_outcomes(),
+                          booking_lock_wait.get_count('single')), before)
+
+    def test_histogram_rendering(self):
+        """
+        Test that histograms render cumulative le buckets ending in +Inf, with their sum and count
+        """
+        histogram = Histogram('test_seconds', 'Test', ['view'], buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value, 'a"b')
+        self.assertEqual(list(histogram.samples()), [
+            'test_seconds_bucket{view="a\\"b",le="0.1"} 2',
+            'test_seconds_bucket{view="a\\"b",le="1"} 3',
+            'test_seconds_bucket{view="a\\"b",le="+Inf"} 4',
+            'test_seconds_sum{view="a\\"b"} 3.65',
+            'test_seconds_count{view="a\\"b"} 4',
+        ])
+
+    def test_metrics_endpoint(self):
+        """
+        Test that /metrics/ serves the registry in the Prometheus text format
+        """
+        self.client.get(reverse('classes'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('# TYPE booking_api_request_duration_seconds histogram\n', text)
+        self.assertIn('# HELP booking_api_requests_total Requests by view, method and status code\n', text)
+        self.assertIn('# TYPE booking_api_requests_total counter\n', text)
+        self.assertIn('booking_api_request_duration_seconds_bucket{view="FitnessClassListView",le="+Inf"} ', text)
+        self.assertRegex(text, r'booking_api_requests_total\{view="FitnessClassListView",method="GET",'
+                               r'status="200"\} \d+')
@@ -0,0 +1,201 @@
+import hashlib
+import math
+from collections import Counter
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    cache backed token bucket: a rate of n/period holds up to n tokens, refilled
+    continuously at n per period, and each request takes get_cost() of them
+
+    Rates come from the BOOKING_THROTTLE_RATES setting by scope, a missing or
+    None rate disables the throttle. The read-modify-write of a bucket is not
+    atomic across processes, like DRF's own throttles a burst may get a few
+    requests more than the rate.
+    """
+    cache_format = 'booking_api:throttle:%(scope)s:%(ident)s'
+
+    def __init__(self):
+        super().__init__()
+        # the backend itself, each call through the default cache proxy costs a thread local lookup
+        self.cache = caches[DEFAULT_CACHE_ALIAS]
+
+    def get_rate(self):
+        # read per request (not at import like DRF's THROTTLE_RATES) so rates follow the settings
+        return getattr(settings, 'BOOKING_THROTTLE_RATES', {}).get(self.scope)
+
+    def get_ident_value(self, request):
+        """
+        what the bucket is keyed by, None when the request has nothing to throttle on
+        """
+        raise NotImplementedError('.get_ident_value() must be overridden')
+
+    def get_cost(self, request):
+        return 1
+
+    def get_ident_costs(self, request):
+        """
+        {bucket ident: tokens to take}, one bucket unless a batch spans several
+        """
+        ident = self.get_ident_value(request)
+        return {} if ident is None else {ident: self.get_cost(request)}
+
+    def get_bucket_key(self, ident):
+        # hashed so emails and other client supplied values are always valid cache keys
+        ident = hashlib.blake2b(str(ident).encode(), digest_size=12).hexdigest()
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def get_cache_key(self, request, view):
+        ident = self.get_ident_value(request)
+        return None if ident is None else self.get_bucket_key(ident)
+
+    def take(self, bucket, cost):
+        """
+        new bucket state after taking cost tokens, sets self.wait_seconds when there are not enough
+        """
+        self.now = self.timer()
+        refill = self.num_requests / self.duration
+        tokens, updated = bucket or (self.num_requests, self.now)
+        tokens = min(self.num_requests, tokens + (self.now - updated) * refill)
+        # a cost above the bucket size could never be paid, charge a full bucket instead
+        cost = min(cost, self.num_requests)
+        self.wait_seconds = None if tokens >= cost else (cost - tokens) / refill
+        return (tokens - cost if self.wait_seconds is None else tokens), self.now
+
+    def take_all(self, buckets, costs):
+        """
+        new state of every bucket, charged only when all of them have enough tokens;
+        self.wait_seconds is the longest wait of the ones that do not
+        """
+        taken, waits = {}, []
+        for key, cost in costs.items():
+            taken[key] = self.take(buckets.get(key), cost)
+            if self.wait_seconds is not None:
+                waits.append(self.wait_seconds)
+        self.wait_seconds = max(waits) if waits else None
+        return taken if self.wait_seconds is None else {}
+
+    def get_key_costs(self, request):
+        if self.rate is None:
+            return {}
+        return {self.get_bucket_key(ident): cost for ident, cost in self.get_ident_costs(request).items()}
+
+    def allow_request(self, request, view):
+        costs = self.get_key_costs(request)
+        if not costs:
+            return True
+        self.cache.set_many(self.take_all(self.cache.get_many(list(costs)), costs), self.duration)
+        return self.wait_seconds is None
+
+    async def aallow_request(self, request, view):
+        costs = self.get_key_costs(request)
+        if not costs:
+            return True
+        await self.cache.aset_many(self.take_all(await self.cache.aget_many(list(costs)), costs), self.duration)
+        return self.wait_seconds is None
+
+    def wait(self):
+        return self.wait_seconds
+
+
+def get_request_data(request):
+    """
+    parsed body of a DRF request, None for plain Django requests
+    """
+    return getattr(request, 'data', None)
+
+
+class BookingIPThrottle(TokenBucketThrottle):
+    """
+    bookings per client IP, a batch costs one token per item
+    """
+    scope = 'book_ip'
+
+    def get_ident_value(self, request):
+        return self.get_ident(request)
+
+    def get_cost(self, request):
+        data = get_request_data(request)
+        return len(data) if isinstance(data, list) and data else 1
+
+
+class BookingItemThrottle(TokenBucketThrottle):
+    """
+    bookings per value of a booking field, a batch takes one token per item from
+    the bucket of each item's value and is rejected when any of them runs out
+    """
+
+    def get_item_value(self, item):
+        raise NotImplementedError('.get_item_value() must be overridden')
+
+    def get_ident_value(self, request):
+        data = get_request_data(request)
+        return self.get_item_value(data) if hasattr(data, 'get') else None
+
+    def get_ident_costs(self, request):
+        data = get_request_data(request)
+        if not isinstance(data, list):
+            return super().get_ident_costs(request)
+        costs = Counter(self.get_item_value(item) for item in data if hasattr(item, 'get'))
+        costs.pop(None, None)
+        return costs
+
+
+class BookingEmailThrottle(BookingItemThrottle):
+    scope = 'book_email'
+
+    def get_item_value(self, item):
+        email = item.get('client_email')
+        return email.strip().lower() if isinstance(email, str) and email else None
+
+
+class BookingClassThrottle(BookingItemThrottle):
+    """
+    bookings per class, keeps scripted clients from queueing on one class's row lock
+    """
+    scope = 'book_class'
+
+    def get_item_value(self, item):
+        class_id = item.get('class_id')
+        return str(class_id) if class_id else None
+
+
+class LookupIPThrottle(TokenBucketThrottle):
+    scope = 'lookup_ip'
+
+    def get_ident_value(self, request):
+        return self.get_ident(request)
+
+
+class AvailabilityIPThrottle(LookupIPThrottle):
+    """
+    availability lookups per client IP, its own bucket so polling widgets do not use up the booking lookups
+    """
+    scope = 'availability_ip'
+
+
+class LookupEmailThrottle(TokenBucketThrottle):
+    scope = 'lookup_email'
+
+    def get_ident_value(self, request):
+        email = getattr(request, 'query_params', request.GET).get('email')
+        return email.strip().lower() if email else None
+
+
+async def acheck_throttles(view, request):
+    """
+    APIView.check_throttles() for the plain async views, the 429 response or None
+    """
+    waits = [throttle.wait() for throttle in (throttle_class() for throttle_class in view.throttle_classes)
+             if not await throttle.aallow_request(request, view)]
+    if not waits:
+        return None
+    wait = max(waits)
+    return JsonResponse({"detail": Throttled(wait).detail}, status=status.HTTP_429_TOO_MANY_REQUESTS,
+                        headers={'Retry-After': str(math.ceil(wait))})
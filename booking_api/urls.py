@@ -1,8 +1,26 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# ASYNC_READ_VIEWS serves the read endpoints with the native async views (for ASGI deployments)
+if getattr(settings, 'ASYNC_READ_VIEWS', False):
+    class_list_view = views.AsyncFitnessClassListView.as_view()
+    booking_list_view = views.AsyncBookingListView.as_view()
+else:
+    class_list_view = views.FitnessClassListView.as_view()
+    booking_list_view = views.BookingListView.as_view()
+
 urlpatterns = [
-    path('classes/', views.FitnessClassListView.as_view(), name='classes'),
+    path('classes/', class_list_view, name='classes'),
+    path('classes/cache-stats/', views.ClassCacheStatsView.as_view(), name='classes-cache-stats'),
+    path('classes/availability/', views.ClassAvailabilityView.as_view(), name='classes-availability'),
+    path('classes/stream/', views.AvailabilityStreamView.as_view(), name='classes-stream'),
     path('book/', views.BookingCreateView.as_view(), name='book'),
-    path('bookings/', views.BookingListView.as_view(), name='bookings'),
+    path('book/batch/', views.BatchBookingCreateView.as_view(), name='book-batch'),
+    path('bookings/', booking_list_view, name='bookings'),
+    path('bookings/export/', views.BookingExportView.as_view(), name='bookings-export'),
+    path('classes/<int:class_id>/roster/', views.BookingExportView.as_view(), name='class-roster'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+    path('async/classes/', views.AsyncFitnessClassListView.as_view(), name='async-classes'),
+    path('async/bookings/', views.AsyncBookingListView.as_view(), name='async-bookings'),
 ]
@@ -1,22 +1,122 @@
+import asyncio
+import json
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
-from .models import FitnessClass, Booking
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from .models import FitnessClass, Booking, ArchivedBooking
+from .admission import admission_queue, QueueFull
+from .events import get_broker
+from .availability import slot_snapshot
+from .idempotency import idempotent
+from .metrics import count_booking_outcomes, registry
+from .throttling import (AvailabilityIPThrottle, BookingIPThrottle, BookingEmailThrottle, BookingClassThrottle,
+                         LookupIPThrottle, LookupEmailThrottle, acheck_throttles)
+from .instrumentation import timed
+from .cache import (get_schedule_version, aget_schedule_version, get_listing_etag, record_cache_event,
+                    get_cache_stats)
+from .pagination import KeysetPagination, BookingKeysetPagination
+from .routers import is_primary_pinned
+from .export import EXPORT_FORMATS, get_export_bookings, iter_export_rows, render_export
+from rest_framework.exceptions import NotFound, PermissionDenied
+from rest_framework.permissions import IsAdminUser
 from rest_framework.views import APIView
 from django.utils import timezone
-from .serializers import FitnessClassListSerializer, CreateBookingSerializer, BookingListSerializer
+from django.db.models import Q
+from django.views import View
+from .serializers import (CreateBookingSerializer, BatchBookingItemSerializer, FitnessClassProjection,
+                          BookingProjection, create_class_bookings, get_request_timezone, get_requested_fields,
+                          parse_datetime_param)
+from .stripes import available_slots_expression
 from rest_framework.response import Response
 from rest_framework import serializers, status
 
 
+def get_listed_classes(params, tz_name):
+    """
+    upcoming classes narrowed by the instructor, name, from, to and available parameters
+    """
+    classes = FitnessClass.objects.filter(start_time__gte=timezone.now())
+    if params.get('instructor'):
+        classes = classes.filter(instructor=params['instructor'])
+    if params.get('name'):
+        classes = classes.filter(name=params['name'])
+    if params.get('from'):
+        classes = classes.filter(start_time__gte=parse_datetime_param(params['from'], tz_name, 'from'))
+    if params.get('to'):
+        classes = classes.filter(start_time__lt=parse_datetime_param(params['to'], tz_name, 'to', end_of_day=True))
+    if params.get('available') == 'true':
+        # the first condition is the one of the fitnessclass_bookable partial index,
+        # the second drops sold out striped classes
+        classes = classes.filter(Q(available_slots__gt=0) | Q(stripes__gt=0)).alias(
+            slots_left=available_slots_expression()).filter(slots_left__gt=0)
+    return classes
+
+
 class FitnessClassListView(APIView):
     def get(self, request):
-        classes = FitnessClass.objects.filter(start_time__gte=timezone.now()).order_by('start_time')
+        tz_name = get_request_timezone(request)
+        classes = get_listed_classes(request.query_params, tz_name)
+        fields = get_requested_fields(request, FitnessClassProjection.output_fields)
+        projection = FitnessClassProjection(tz_name, fields)
+
+        # the ETag is derived from the schedule version alone, so polling clients
+        # are answered without touching the ORM or the serializers
+        etag = get_listing_etag(request, get_schedule_version(), tz_name)
+        # a client pinned to the primary just wrote, and the page cached under the new version (or its ETag)
+        # may come from a lagging replica; it gets a page read from the primary, which replaces the cached one
+        pinned = is_primary_pinned()
+        if not pinned and etag in parse_etags(request.headers.get('If-None-Match', '')):
+            record_cache_event('not_modified')
+            response = Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        else:
+            cache_key = f'booking_api:classes:{etag}'
+            data = None if pinned else cache.get(cache_key)
+            if data is None:
+                record_cache_event('misses')
+                data = self.get_listing(request, classes, projection)
+                cache.set(cache_key, data, getattr(settings, 'CLASSES_CACHE_TIMEOUT', 30))
+            else:
+                record_cache_event('hits')
+            response = Response(data, status=status.HTTP_200_OK, headers={'ETag': etag})
+
+        patch_vary_headers(response, ['X-Timezone'])
+        return response
+
+    def get_listing(self, request, classes, projection):
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(projection.get_queryset(classes), request, view=self)
 
-        serialized = FitnessClassListSerializer(classes, many=True)
+        with timed('serialize'):
+            return paginator.get_paginated_data(projection.to_representation(page))
 
-        return Response(serialized.data, status=status.HTTP_200_OK)
+
+class MetricsView(View):
+    """
+    this process's request, booking and lock wait metrics in the Prometheus text format
+    """
+
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ClassCacheStatsView(APIView):
+    def get(self, request):
+        return Response(get_cache_stats(), status=status.HTTP_200_OK)
 
 
 class BookingCreateView(APIView):
+    # checked before the handler, over-limit requests never reach the ORM
+    throttle_classes = [BookingIPThrottle, BookingEmailThrottle, BookingClassThrottle]
+
+    @idempotent
+    @count_booking_outcomes
     def post(self, request):
         class_id = request.data.get('class_id')
         client_name = request.data.get('client_name')
@@ -26,29 +126,367 @@ class BookingCreateView(APIView):
         if not all([class_id, client_name, client_email]):
             return Response({"error": "Missing fields"}, status=status.HTTP_400_BAD_REQUEST)
 
+        admission = getattr(settings, 'BOOKING_ADMISSION_QUEUE', False)
+        capacity_version = admission_queue.get_capacity_version(class_id) if admission else None
+        if admission and admission_queue.is_sold_out(class_id, capacity_version):
+            # known sold out, rejected without touching the database
+            return Response({"error": ["No available slots for this class"]}, status=status.HTTP_400_BAD_REQUEST)
+
         serializer = CreateBookingSerializer(data=request.data)
 
-        if serializer.is_valid():
+        with timed('validate'):
+            is_valid = serializer.is_valid()
+
+        if is_valid:
             try:
-                serializer.save()
+                with timed('book'):
+                    if admission:
+                        serializer.instance = admission_queue.book(serializer.validated_data)
+                    else:
+                        serializer.save()
+                with timed('serialize'):
+                    data = serializer.data
                 return Response({
                     "message": "Booking created successfully",
-                    "booking": serializer.data
+                    "booking": data
                 }, status=status.HTTP_201_CREATED)
             except serializers.ValidationError as e:
-                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+                return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+            except (QueueFull, TimeoutError):
+                return Response({"error": "Too many bookings for this class, try again"},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
             except Exception as e:
                 return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        if admission and 'No available slots for this class' in serializer.errors.get('error', []):
+            admission_queue.mark_sold_out(class_id, capacity_version)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class BatchBookingCreateView(APIView):
+    # the same buckets as /book/, each item takes a token from its email's and its class's
+    throttle_classes = [BookingIPThrottle, BookingEmailThrottle, BookingClassThrottle]
+
+    @idempotent
+    @count_booking_outcomes
+    def post(self, request):
+        items = request.data
+        max_items = getattr(settings, 'BOOKING_BATCH_MAX_ITEMS', 100)
+
+        if not isinstance(items, list) or not items:
+            return Response({"error": "Expected a list of bookings"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > max_items:
+            return Response({"error": f"At most {max_items} bookings per batch"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # fetch every referenced class once instead of once per item
+        class_ids = set()
+        for item in items:
+            try:
+                class_ids.add(int(item.get('class_id')))
+            except (AttributeError, TypeError, ValueError):
+                pass
+        classes = FitnessClass.objects.in_bulk(class_ids)
+
+        results = [None] * len(items)
+        groups = defaultdict(list)
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results[index] = {"status": status.HTTP_400_BAD_REQUEST, "error": "Invalid booking"}
+                continue
+
+            # Check if all required fields are present
+            if not all([item.get('class_id'), item.get('client_name'), item.get('client_email')]):
+                results[index] = {"status": status.HTTP_400_BAD_REQUEST, "error": "Missing fields"}
+                continue
+
+            serializer = BatchBookingItemSerializer(data=item, context={'classes': classes})
+            if serializer.is_valid():
+                groups[serializer.validated_data['fitness_class'].id].append((index, serializer.validated_data))
+            else:
+                results[index] = {"status": status.HTTP_400_BAD_REQUEST, **serializer.errors}
+
+        for class_id, group in groups.items():
+            for index, (booking, error) in create_class_bookings(classes[class_id], group).items():
+                if error is not None:
+                    results[index] = {"status": status.HTTP_400_BAD_REQUEST, **error}
+                else:
+                    results[index] = {
+                        "status": status.HTTP_201_CREATED,
+                        "message": "Booking created successfully",
+                        "booking": CreateBookingSerializer(booking).data,
+                    }
+
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+def get_client_bookings(params, model=Booking):
+    """
+    bookings for the email query parameter, optionally only upcoming or past ones
+
+    model is Booking or ArchivedBooking, which have the same fields and lookups
+    """
+    client_email = params.get('email')
+    if not client_email:
+        raise serializers.ValidationError({"error": "Email is required"})
+
+    upcoming = params.get('upcoming') == 'true'
+    past = params.get('past') == 'true'
+    if upcoming and past:
+        raise serializers.ValidationError({"error": "Use either upcoming or past, not both"})
+
+    bookings = model.objects.filter(client_email=client_email)
+    if upcoming:
+        bookings = bookings.filter(fitness_class__start_time__gte=timezone.now())
+    elif past:
+        bookings = bookings.filter(fitness_class__start_time__lt=timezone.now())
+    return bookings
+
+
+def get_client_booking_querysets(params):
+    """
+    the client's bookings, followed by their archived ones with include_archived=true
+    """
+    querysets = [get_client_bookings(params)]
+    if params.get('include_archived') == 'true':
+        querysets.append(get_client_bookings(params, ArchivedBooking))
+    return querysets
+
+
+def get_booking_projection(request, tz_name):
+    """
+    booking projection for the fields and normalize query parameters
+    """
+    params = getattr(request, 'query_params', request.GET)
+    fields = get_requested_fields(request, BookingProjection.output_fields)
+    return BookingProjection(tz_name, fields, normalize=params.get('normalize') == 'true')
+
+
+def get_booking_page_data(paginator, projection, page):
+    data = paginator.get_paginated_data(projection.to_representation(page))
+    if projection.normalize:
+        # each class of the page once, referenced by id from the bookings
+        data['classes'] = list(projection.classes.values())
+    return data
+
+
 class BookingListView(APIView):
+    throttle_classes = [LookupIPThrottle, LookupEmailThrottle]
+
     def get(self, request):
-        client_email = request.query_params.get('email')
-        if not client_email:
-            return Response({"error": "Email is required"}, status=status.HTTP_400_BAD_REQUEST)
+        querysets = get_client_booking_querysets(request.query_params)
+        tz_name = get_request_timezone(request)
+
+        # the projection joins each booking's class in the same query instead of one query per booking
+        projection = get_booking_projection(request, tz_name)
+        paginator = BookingKeysetPagination()
+        page = paginator.paginate_querysets([projection.get_queryset(bookings) for bookings in querysets],
+                                            request, view=self)
+        with timed('serialize'):
+            response = Response(get_booking_page_data(paginator, projection, page))
+        patch_vary_headers(response, ['X-Timezone'])
+        return response
+
+
+class BookingExportView(View):
+    """
+    stream bookings joined to their class as NDJSON or CSV, in constant memory
+
+    a plain django view, DRF would treat ?format= as a renderer override, so the
+    permission_classes (staff only, exports hold every client's email) are checked in dispatch()
+    """
+    permission_classes = [IsAdminUser]
+
+    def dispatch(self, request, *args, **kwargs):
+        if not all(permission().has_permission(request, self) for permission in self.permission_classes):
+            return JsonResponse({"detail": PermissionDenied.default_detail}, status=status.HTTP_403_FORBIDDEN)
+        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request, class_id=None):
+        export_format = request.GET.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return JsonResponse({"error": "Format must be ndjson or csv"}, status=status.HTTP_400_BAD_REQUEST)
+
+        params = request.GET.dict()
+        if class_id is not None:
+            # roster of one class
+            if not FitnessClass.objects.filter(id=class_id).exists():
+                return JsonResponse({"error": "Class not found"}, status=status.HTTP_404_NOT_FOUND)
+            params['class_id'] = str(class_id)
+
+        try:
+            tz_name = get_request_timezone(request)
+            bookings = get_export_bookings(params, tz_name)
+        except serializers.ValidationError as e:
+            return JsonResponse(e.detail, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = iter_export_rows(bookings, tz_name, getattr(settings, 'EXPORT_CHUNK_SIZE', 2000))
+        response = StreamingHttpResponse(render_export(rows, export_format), content_type=EXPORT_FORMATS[export_format])
+        filename = f'roster-{class_id}' if class_id is not None else 'bookings'
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+        patch_vary_headers(response, ['X-Timezone'])
+        return response
+
+
+class AsyncFitnessClassListView(View):
+    """
+    native async variant of FitnessClassListView for ASGI deployments
+    """
+
+    async def get(self, request):
+        try:
+            tz_name = get_request_timezone(request)
+            classes = get_listed_classes(request.GET, tz_name)
+            fields = get_requested_fields(request, FitnessClassProjection.output_fields)
+            projection = FitnessClassProjection(tz_name, fields)
+        except serializers.ValidationError as e:
+            return JsonResponse(e.detail, status=status.HTTP_400_BAD_REQUEST)
+
+        etag = get_listing_etag(request, await aget_schedule_version(), tz_name)
+        # as in FitnessClassListView, clients pinned to the primary skip the cached page
+        pinned = is_primary_pinned()
+        if not pinned and etag in parse_etags(request.headers.get('If-None-Match', '')):
+            record_cache_event('not_modified')
+            response = HttpResponseNotModified(headers={'ETag': etag})
+        else:
+            cache_key = f'booking_api:classes:{etag}'
+            data = None if pinned else await cache.aget(cache_key)
+            if data is None:
+                record_cache_event('misses')
+                try:
+                    data = await self.get_listing(request, classes, projection)
+                except NotFound as e:
+                    return JsonResponse({"detail": e.detail}, status=status.HTTP_404_NOT_FOUND)
+                await cache.aset(cache_key, data, getattr(settings, 'CLASSES_CACHE_TIMEOUT', 30))
+            else:
+                record_cache_event('hits')
+            response = JsonResponse(data, status=status.HTTP_200_OK, headers={'ETag': etag})
+
+        patch_vary_headers(response, ['X-Timezone'])
+        return response
+
+    async def get_listing(self, request, classes, projection):
+        paginator = KeysetPagination()
+        page = await paginator.apaginate_queryset(projection.get_queryset(classes), request, view=self)
+
+        with timed('serialize'):
+            return paginator.get_paginated_data(projection.to_representation(page))
+
+
+class AsyncBookingListView(View):
+    """
+    native async variant of BookingListView for ASGI deployments
+    """
+    throttle_classes = [LookupIPThrottle, LookupEmailThrottle]
+
+    async def get(self, request):
+        throttled = await acheck_throttles(self, request)
+        if throttled is not None:
+            return throttled
+
+        try:
+            querysets = get_client_booking_querysets(request.GET)
+            tz_name = get_request_timezone(request)
+            projection = get_booking_projection(request, tz_name)
+        except serializers.ValidationError as e:
+            return JsonResponse(e.detail, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = BookingKeysetPagination()
+        try:
+            page = await paginator.apaginate_querysets([projection.get_queryset(bookings) for bookings in querysets],
+                                                       request, view=self)
+        except NotFound as e:
+            return JsonResponse({"detail": e.detail}, status=status.HTTP_404_NOT_FOUND)
+
+        with timed('serialize'):
+            response = JsonResponse(get_booking_page_data(paginator, projection, page))
+        patch_vary_headers(response, ['X-Timezone'])
+        return response
+
+
+def get_class_ids(params, max_classes):
+    """
+    the distinct class ids of the ids query parameter, in request order
+    """
+    try:
+        class_ids = list(dict.fromkeys(int(class_id) for class_id in params.get('ids', '').split(',')))
+    except ValueError:
+        raise serializers.ValidationError({"error": "ids must be a comma separated list of class ids"})
+    if len(class_ids) > max_classes:
+        raise serializers.ValidationError({"error": f"At most {max_classes} class ids per request"})
+    return class_ids
+
+
+class ClassAvailabilityView(APIView):
+    """
+    {id: available slots} of the classes in ?ids=, null for unknown ones, from the slot snapshot
+    """
+    throttle_classes = [AvailabilityIPThrottle]
+
+    def get(self, request):
+        class_ids = get_class_ids(request.query_params, getattr(settings, 'AVAILABILITY_LOOKUP_MAX_CLASSES', 100))
+        slots = slot_snapshot.get_many(class_ids)
+        # string keys, JSON objects have no others
+        return Response({str(class_id): slots[class_id] for class_id in class_ids})
+
+
+class AvailabilityStreamView(View):
+    """
+    server-sent events with the available slots of the classes in ?ids=, for ASGI deployments
+
+    Sends every class once, then an event per class whose slots changed, at most
+    once per AVAILABILITY_STREAM_INTERVAL however many bookings came in between.
+    """
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            # a sync server would buffer the endless stream instead of sending it
+            return JsonResponse({"error": "The availability stream needs an ASGI server"},
+                                status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        try:
+            class_ids = get_class_ids(request.GET, getattr(settings, 'AVAILABILITY_STREAM_MAX_CLASSES', 100))
+        except serializers.ValidationError as e:
+            return JsonResponse(e.detail, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(self.stream(class_ids), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # no proxy buffering, events have to reach the client as they are sent
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, class_ids):
+        broker = get_broker()
+        interval = getattr(settings, 'AVAILABILITY_STREAM_INTERVAL', 1)
+        heartbeat = getattr(settings, 'AVAILABILITY_STREAM_HEARTBEAT', 15)
+        deadline = time.monotonic() + getattr(settings, 'AVAILABILITY_STREAM_MAX_SECONDS', 300)
+
+        # versions first, a change racing the snapshot is then sent once more rather than lost
+        versions = await broker.aget_versions(class_ids)
+        yield f'retry: {int(interval * 1000) + 1000}\n\n'
+        for event in await self.get_events(class_ids):
+            yield event
+        last_sent = time.monotonic()
+
+        # ends after AVAILABILITY_STREAM_MAX_SECONDS, EventSource reconnects and gets a fresh snapshot
+        while time.monotonic() < deadline:
+            await asyncio.sleep(interval)
+            current = await broker.aget_versions(class_ids)
+            changed = [class_id for class_id in class_ids if current[class_id] != versions[class_id]]
+            versions = current
+            if changed:
+                for event in await self.get_events(changed):
+                    yield event
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= heartbeat:
+                yield ': keep-alive\n\n'
+                last_sent = time.monotonic()
 
-        serializer = BookingListSerializer(Booking.objects.filter(client_email=client_email), many=True)
-        result = serializer.data
-        return Response(result)
+    async def get_events(self, class_ids):
+        # read from the primary, a lagging replica could miss the change that was announced
+        classes = FitnessClass.objects.using(router.db_for_write(FitnessClass)).filter(id__in=class_ids).values(
+            'id', slots=available_slots_expression())
+        slots = {row['id']: row['slots'] async for row in classes}
+        # deleted or unknown classes are sent with null slots
+        return [f'event: availability\ndata: {json.dumps({"id": class_id, "available_slots": slots.get(class_id)})}\n\n'
+                for class_id in class_ids]
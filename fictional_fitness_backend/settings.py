@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'booking_api.middleware.RequestInstrumentationMiddleware',
+    'booking_api.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,6 +82,60 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # persistent connections keep their PRAGMAs and skip a reconnect per request,
+        # set it to 0 when serving through ASGI where requests do not reuse threads
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # BEGIN IMMEDIATE takes the write lock when a transaction starts, so concurrent
+            # booking transactions wait on the busy timeout instead of failing with
+            # "database is locked" when upgrading a read lock
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # file backed test database, the in-memory shared cache database raises
+        # "table is locked" instead of waiting when test threads write concurrently
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    },
+    # a second SQLite file standing in for a read replica,
+    # `python manage.py sync_replica` copies the primary into it
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db_replica.sqlite3',
+        },
+    },
+}
+
+# Reads go to these aliases, writes and select_for_update() to 'default' (booking_api.routers)
+DATABASE_ROUTERS = ['booking_api.routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = []
+# Seconds a client keeps reading from the primary after a write, so it sees its own bookings
+REPLICA_STICKY_SECONDS = 5
+
+
+# Applied to every new SQLite connection (booking_api.signals): WAL lets readers run alongside the
+# writer, synchronous=NORMAL only fsyncs at checkpoints, busy_timeout (ms) makes writers queue
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory is per process, use a shared backend (Redis, Memcached) when running
+# several workers so schedule version bumps reach every worker
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fitness-booking',
     }
 }
 
@@ -104,8 +160,98 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'USE_TZ': True,
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        # opt-in with ?format=fastjson, renders with orjson (see booking_api.renderers for how floats differ)
+        'booking_api.renderers.FastJSONRenderer',
+    ],
 }
 
+# Booking API
+# Default and maximum ?page_size= of the keyset paginated list endpoints
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
+# Maximum number of items accepted by POST /book/batch/
+BOOKING_BATCH_MAX_ITEMS = 100
+
+# Count requests, booking outcomes and slot lock waits for GET /metrics/ (Prometheus text format, per process)
+METRICS_ENABLED = True
+
+# Requests slower than this are logged to the booking_api.requests logger with their timings
+REQUEST_SLOW_THRESHOLD_MS = 500
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # the slow request log, one JSON object per request
+        'booking_api.requests': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+# Allow ?profile=1 to answer with the request's cProfile stats, never enable this on a public deployment.
+# With REQUEST_PROFILE_DIR set the .prof dumps are also written there.
+REQUEST_PROFILING_ENABLED = False
+REQUEST_PROFILE_DIR = None
+
+# Rows fetched per query by the streaming booking exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Token bucket throttles (booking_api.throttling): 'n/period' allows bursts of n refilled at n per period,
+# None disables a scope. Writes are POST /book/ and /book/batch/ (one token per item from each bucket),
+# reads are GET /bookings/ and, in their own bucket, GET /classes/availability/.
+# Over-limit requests get 429 with Retry-After.
+BOOKING_THROTTLE_RATES = {
+    'book_ip': '60/min',
+    'book_email': '10/min',
+    'book_class': '1200/min',
+    'lookup_ip': '300/min',
+    'lookup_email': '60/min',
+    'availability_ip': '600/min',
+}
+
+# POST /book/ and /book/batch/ with an Idempotency-Key header: seconds the first response is replayed for,
+# seconds a repeat waits for the in-flight first request, seconds an abandoned in-flight key stays held
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_WAIT_TIMEOUT = 10
+IDEMPOTENCY_LOCK_TIMEOUT = 30
+
+# Route POST /book/ through per class admission queues drained in batches (flash sales)
+BOOKING_ADMISSION_QUEUE = False
+# Pending bookings per class before new ones get 503, bookings per transaction, seconds a request waits
+BOOKING_ADMISSION_MAX_QUEUE = 1000
+BOOKING_ADMISSION_MAX_BATCH = 100
+BOOKING_ADMISSION_TIMEOUT = 10
+
+# Serve /classes/ and /bookings/ with the native async views, for ASGI deployments
+# (the async views are also always available under /async/)
+ASYNC_READ_VIEWS = False
+
+# GET /classes/stream/ (server-sent events, ASGI only): how changes reach the streams (InProcessBroker for a single
+# worker, CacheBroker shares them through CACHES), seconds between change checks (one event per class at most),
+# seconds between keep-alive comments, seconds before a stream ends and the client reconnects, classes per stream
+AVAILABILITY_BROKER = 'booking_api.events.InProcessBroker'
+AVAILABILITY_STREAM_INTERVAL = 1
+AVAILABILITY_STREAM_HEARTBEAT = 15
+AVAILABILITY_STREAM_MAX_SECONDS = 300
+AVAILABILITY_STREAM_MAX_CLASSES = 100
+
+# GET /classes/availability/: most class ids per lookup, and the process local snapshot behind it (seconds an entry
+# may be served when no change reaches AVAILABILITY_BROKER, most classes kept)
+AVAILABILITY_LOOKUP_MAX_CLASSES = 100
+AVAILABILITY_SNAPSHOT_MAX_AGE = 5
+AVAILABILITY_SNAPSHOT_MAX_CLASSES = 10000
+
+# archive_past moves classes that started more than this many days ago to the archive tables by default
+ARCHIVE_AFTER_DAYS = 30
+
+# Seconds a cached /classes/ page (and its ETag) stays valid when the schedule does not change
+CLASSES_CACHE_TIMEOUT = 30
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 